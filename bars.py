@@ -0,0 +1,116 @@
+"""OHLCV足の集計
+
+ティックを interval 秒ごとの足（始値・高値・安値・終値・出来高・ティック数）に
+まとめる。update() はティックごとに O(1)、batch() はバックフィル用のNumPy版::
+
+    bars = BarSeries(10)
+    completed = bars.update(epoch, price, volume)  # 足が確定した時だけタプルを返す
+    bars.last(30)["close"]
+"""
+import numpy as np
+
+from tickstore import TickBuffer
+
+BAR_COLUMNS = ("open", "high", "low", "close", "volume", "count")
+BAR_DTYPE = np.dtype([("time", "<f8")] + [(column, "<f8") for column in BAR_COLUMNS])
+
+
+class BarSeries:
+    """1銘柄分の足。確定した足は TickBuffer に、作成中の足は別に保持する"""
+
+    def __init__(self, interval, max_rows=None):
+        self.interval = float(interval)
+        self._buffer = TickBuffer(BAR_DTYPE, max_rows=max_rows)
+        # 作成中の足 [開始時刻, 始値, 高値, 安値, 終値, 出来高, ティック数]
+        self._current = None
+
+    def __len__(self):
+        return len(self._buffer) + (self._current is not None)
+
+    def bar_start(self, epoch):
+        return epoch - epoch % self.interval
+
+    def update(self, epoch, price, volume=0.0):
+        """ティックを反映し、足が確定した場合はその足（タプル）を返す"""
+        if not volume > 0:
+            volume = 0.0
+        start = self.bar_start(epoch)
+        current = self._current
+        if current is not None and start <= current[0]:
+            if price > current[2]:
+                current[2] = price
+            if price < current[3]:
+                current[3] = price
+            current[4] = price
+            current[5] += volume
+            current[6] += 1
+            return None
+
+        completed = None
+        if current is not None:
+            completed = tuple(current)
+            self._buffer.append_row(completed)
+        self._current = [start, price, price, price, price, volume, 1]
+        return completed
+
+    def flush(self):
+        """作成中の足を確定させて返す（無ければ None）"""
+        if self._current is None:
+            return None
+        completed = tuple(self._current)
+        self._buffer.append_row(completed)
+        self._current = None
+        return completed
+
+    def batch(self, times, prices, volumes=None):
+        """複数ティックをまとめて集計（バックフィル用）"""
+        times = np.asarray(times, dtype=float)
+        prices = np.asarray(prices, dtype=float)
+        if not len(times):
+            return
+        if volumes is None:
+            volumes = np.zeros(len(times))
+        volumes = np.where(np.asarray(volumes, dtype=float) > 0, volumes, 0.0)
+
+        starts = times - times % self.interval
+        # 作成中の足と同じ区間のティックは1件ずつ反映
+        position = 0
+        if self._current is not None:
+            position = int(np.searchsorted(starts, self._current[0], side="right"))
+            for i in range(position):
+                self.update(times[i], prices[i], volumes[i])
+        if position == len(times):
+            return
+
+        starts, prices, volumes = starts[position:], prices[position:], volumes[position:]
+        first = np.concatenate([[0], np.flatnonzero(np.diff(starts)) + 1])
+        last = np.concatenate([first[1:] - 1, [len(starts) - 1]])
+        records = np.empty(len(first), dtype=BAR_DTYPE)
+        records["time"] = starts[first]
+        records["open"] = prices[first]
+        records["high"] = np.maximum.reduceat(prices, first)
+        records["low"] = np.minimum.reduceat(prices, first)
+        records["close"] = prices[last]
+        records["volume"] = np.add.reduceat(volumes, first)
+        records["count"] = last - first + 1
+
+        if self._current is not None:
+            self._buffer.append_row(tuple(self._current))
+        self._buffer.extend(records[:-1])
+        self._current = list(records[-1].tolist())
+
+    def last(self, count):
+        """作成中の足を含む直近 count 本（列配列の辞書）"""
+        completed = count - (self._current is not None)
+        return self._columns(self._buffer.records()[max(len(self._buffer) - completed, 0):])
+
+    def since(self, start):
+        """開始時刻が start 以降の足（作成中の足を含む）"""
+        records = self._buffer.records()
+        begin = np.searchsorted(records["time"], self.bar_start(start), side="left")
+        return self._columns(records[begin:])
+
+    def _columns(self, records):
+        if self._current is not None:
+            records = np.concatenate([records, np.array([tuple(self._current)], dtype=BAR_DTYPE)])
+        return {name: records[name] for name in BAR_DTYPE.names}
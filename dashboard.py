@@ -0,0 +1,301 @@
+"""マルチパネル・ダッシュボード
+
+価格・スプレッド・出来高・足のパネルをグリッドに並べ、1つの RenderScheduler で
+まとめて描画する。
+
+- 各パネルは表示中の銘柄にティックが来た時（または時間軸が進んだ時）だけ描画する
+- 軸の範囲は余裕を持たせてキャッシュし、時間軸は TIME_STEP 秒ごとにしか動かさない
+- 範囲が変わらない間は軸・目盛りラベル・グリッドを描いた背景を再利用し、
+  データのアーティストだけを描き直す（ブリット）
+- 余白は固定（tight_layout は使わない）
+
+パネルの Figure は画面表示なら FigureCanvasTkAgg、ソークテストなら
+FigureCanvasAgg に attach() して使う。
+"""
+import datetime
+import math
+
+import numpy as np
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.colors import to_rgba
+from matplotlib.figure import Figure
+from matplotlib.ticker import FuncFormatter, MultipleLocator
+
+# 表示する時間幅（秒）、時間軸を進める間隔（秒）
+DASHBOARD_WINDOW = 300
+TIME_STEP = 30
+
+# 1パネルに描く最大点数（超える場合は間引く）
+MAX_PANEL_POINTS = 2000
+
+# ダッシュボードの配置（種類, 銘柄）。種類は PANEL_TYPES のキー
+DASHBOARD_LAYOUT = [
+    [("price", "LMCADS03 Comdty"), ("price", "HG1 Comdty"), ("price", "CU1 Comdty")],
+    [("spread", "LME Cash-3M"), ("spread", "LME 3M vs COMEX"), ("spread", "SHFE Import Arb")],
+    [("bars", "LMCADS03 Comdty"), ("volume", "LMCADS03 Comdty"), ("volume", "HG1 Comdty")],
+]
+
+
+def _time_label(x, pos):
+    return datetime.datetime.fromtimestamp(x).strftime('%H:%M')
+
+
+def cached_limits(current, lo, hi, pad=0.25, floor=None):
+    """軸の範囲を決める
+
+    データ範囲 [lo, hi] が現在の範囲に収まり、その30%以上を使っていれば
+    現在の範囲をそのまま返す（目盛りラベルが変わらず、背景を再利用できる）。
+    """
+    if current is not None:
+        current_lo, current_hi = current
+        if lo >= current_lo and hi <= current_hi and hi - lo >= 0.3 * (current_hi - current_lo):
+            return current
+    span = hi - lo
+    if span <= 0:
+        span = max(abs(hi) * 1e-3, 1e-6)
+    new_lo, new_hi = lo - span * pad, hi + span * pad
+    if floor is not None:
+        new_lo = max(new_lo, floor)
+    return (new_lo, new_hi)
+
+
+class Panel:
+    """ダッシュボードの1パネル（1つの Figure と Axes）"""
+
+    def __init__(self, title, securities, figsize=(3, 2)):
+        self.title = title
+        self.securities = tuple(securities)
+        self.fig = Figure(figsize=figsize, dpi=100, facecolor='#2d2d2d')
+        # 余白は固定（毎回のレイアウト計算を避ける）
+        self.fig.subplots_adjust(left=0.2, right=0.96, top=0.86, bottom=0.16)
+        self.ax = self.fig.add_subplot(111, facecolor='#1a1a1a')
+        self.ax.set_title(title, color='white', fontsize=9, pad=4)
+        self.ax.tick_params(colors='white', labelsize=7)
+        for spine in self.ax.spines.values():
+            spine.set_color('#444444')
+        self.ax.grid(True, alpha=0.2, color='#444444', linestyle='-', linewidth=0.5)
+        self.ax.xaxis.set_major_formatter(FuncFormatter(_time_label))
+        self.ax.xaxis.set_major_locator(MultipleLocator(TIME_STEP * 2))
+
+        # 最新値（ブリットで描画）
+        self.value_text = self.ax.text(0.03, 0.9, '', transform=self.ax.transAxes,
+                                       color='white', fontsize=8, fontweight='bold',
+                                       animated=True)
+        # データのアーティスト（animated=True のものは背景に含めない）
+        self.artists = [self.value_text]
+
+        self.canvas = None
+        self._background = None
+        self._limits = None
+        self._render_key = None
+
+    def add_artist(self, artist):
+        artist.set_animated(True)
+        self.artists.append(artist)
+        return artist
+
+    def attach(self, canvas):
+        """描画先のキャンバスを設定"""
+        self.canvas = canvas
+        canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):
+        # 全体を描き直した時（リサイズ含む）に背景を取り直す
+        self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for artist in self.artists:
+            self.ax.draw_artist(artist)
+
+    def invalidate(self):
+        self._background = None
+        self._render_key = None
+
+    def needs_render(self, key):
+        return key != self._render_key
+
+    def render(self, pipeline, window, key):
+        """データを更新して描画。描画した場合 True"""
+        self._render_key = key
+        limits = self.update_data(pipeline, window)
+        if limits is None:
+            return False
+        if limits != self._limits or self._background is None:
+            # 軸の範囲が変わった時だけ全体を描画（draw_event で背景を取り直す）
+            self._limits = limits
+            self.ax.set_xlim(*limits[0])
+            self.ax.set_ylim(*limits[1])
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self._background)
+            self._draw_artists()
+            self.canvas.blit(self.fig.bbox)
+        return True
+
+    def update_data(self, pipeline, window):
+        """アーティストのデータを更新し、(xlim, ylim) を返す（データが無ければ None）"""
+        raise NotImplementedError
+
+
+class LinePanel(Panel):
+    """価格（LAST_PRICE）のライン"""
+
+    color = '#00ff88'
+
+    def __init__(self, security, **kwargs):
+        super().__init__(security, [security], **kwargs)
+        self.security = security
+        self.line = self.add_artist(self.ax.plot([], [], color=self.color, linewidth=1.2)[0])
+
+    def update_data(self, pipeline, window):
+        ticks = pipeline.tick_store.query(self.security, start=window[0], fields=["LAST_PRICE"])
+        times, prices = ticks["time"], ticks["LAST_PRICE"]
+        if not len(times):
+            return None
+        if len(times) > MAX_PANEL_POINTS:
+            step = math.ceil(len(times) / MAX_PANEL_POINTS)
+            times, prices = times[::step], prices[::step]
+        self.line.set_data(times, prices)
+        latest = float(ticks["LAST_PRICE"][-1])
+        self.value_text.set_text(f"{latest:,.2f}")
+        ylim = cached_limits(self._limits and self._limits[1],
+                             float(prices.min()), float(prices.max()))
+        return (window, ylim)
+
+
+class SpreadPanel(LinePanel):
+    """スプレッド（派生銘柄）のライン。ゼロ線付き"""
+
+    color = '#4a9eff'
+
+    def __init__(self, security, **kwargs):
+        super().__init__(security, **kwargs)
+        self.ax.axhline(0, color='#888888', linewidth=0.8, alpha=0.6)
+
+
+class VolumePanel(Panel):
+    """足ごとの出来高"""
+
+    def __init__(self, security, **kwargs):
+        super().__init__(f"{security} Volume", [security], **kwargs)
+        self.security = security
+        self.bars = self.add_artist(PolyCollection([], facecolor='#2196F3', edgecolor='none',
+                                                   alpha=0.8))
+        self.ax.add_collection(self.bars)
+
+    def update_data(self, pipeline, window):
+        series = pipeline.bars.get(self.security)
+        if series is None:
+            return None
+        bars = series.since(window[0])
+        if not len(bars["time"]):
+            return None
+        left = bars["time"] + series.interval * 0.1
+        right = bars["time"] + series.interval * 0.9
+        volume = bars["volume"]
+        zero = np.zeros_like(volume)
+        self.bars.set_verts(np.stack([np.column_stack([left, zero]),
+                                      np.column_stack([left, volume]),
+                                      np.column_stack([right, volume]),
+                                      np.column_stack([right, zero])], axis=1))
+        self.value_text.set_text(f"{volume[-1]:,.0f}")
+        ylim = cached_limits(self._limits and self._limits[1], 0.0,
+                             max(float(volume.max()), 1.0), floor=0.0)
+        return (window, ylim)
+
+
+class BarsPanel(Panel):
+    """ローソク足"""
+
+    up_color = to_rgba('#4CAF50')
+    down_color = to_rgba('#f44336')
+
+    def __init__(self, security, **kwargs):
+        super().__init__(f"{security} Bars", [security], **kwargs)
+        self.security = security
+        self.wicks = self.add_artist(LineCollection([], colors='#cccccc', linewidths=0.8))
+        self.bodies = self.add_artist(PolyCollection([], edgecolor='none'))
+        self.ax.add_collection(self.wicks)
+        self.ax.add_collection(self.bodies)
+
+    def update_data(self, pipeline, window):
+        series = pipeline.bars.get(self.security)
+        if series is None:
+            return None
+        bars = series.since(window[0])
+        if not len(bars["time"]):
+            return None
+        middle = bars["time"] + series.interval * 0.5
+        left = bars["time"] + series.interval * 0.15
+        right = bars["time"] + series.interval * 0.85
+        self.wicks.set_segments(np.stack([np.column_stack([middle, bars["low"]]),
+                                          np.column_stack([middle, bars["high"]])], axis=1))
+        opens, closes = bars["open"], bars["close"]
+        self.bodies.set_verts(np.stack([np.column_stack([left, opens]),
+                                        np.column_stack([left, closes]),
+                                        np.column_stack([right, closes]),
+                                        np.column_stack([right, opens])], axis=1))
+        self.bodies.set_facecolor(np.where((closes >= opens)[:, None],
+                                           self.up_color, self.down_color))
+        self.value_text.set_text(f"{closes[-1]:,.2f}")
+        ylim = cached_limits(self._limits and self._limits[1],
+                             float(bars["low"].min()), float(bars["high"].max()))
+        return (window, ylim)
+
+
+PANEL_TYPES = {
+    "price": LinePanel,
+    "spread": SpreadPanel,
+    "volume": VolumePanel,
+    "bars": BarsPanel,
+}
+
+
+def create_panel(kind, security, **kwargs):
+    return PANEL_TYPES[kind](security, **kwargs)
+
+
+class RenderScheduler:
+    """全パネル共通の描画スケジューラ
+
+    UIの更新ループから1回呼ぶと、時間軸を全パネルで揃えたうえで、
+    データ（または時間軸）が変わったパネルだけを描画する。
+    """
+
+    def __init__(self, pipeline, panels=()):
+        self.pipeline = pipeline
+        self.panels = list(panels)
+        # 非表示の間は描画しない
+        self.active = True
+
+    def add(self, panel):
+        self.panels.append(panel)
+
+    def invalidate(self):
+        """全パネルを次回必ず全体描画する（表示切り替え時など）"""
+        for panel in self.panels:
+            panel.invalidate()
+
+    def window(self):
+        """全パネル共通の時間軸（TIME_STEP 秒単位で進める）"""
+        latest = self.pipeline.latest_epoch
+        if latest is None:
+            return None
+        end = math.ceil(latest / TIME_STEP) * TIME_STEP + TIME_STEP
+        return (end - DASHBOARD_WINDOW, end)
+
+    def render(self):
+        """描画したパネル数を返す"""
+        if not self.active:
+            return 0
+        window = self.window()
+        if window is None:
+            return 0
+        versions = self.pipeline.versions
+        rendered = 0
+        for panel in self.panels:
+            key = (window,) + tuple(versions.get(security, 0) for security in panel.securities)
+            if panel.needs_render(key) and panel.render(self.pipeline, window, key):
+                rendered += 1
+        return rendered
@@ -0,0 +1,171 @@
+"""銘柄ごとの配信ポリシー（購読間隔・コンフレーション）
+
+フィードスレッドで受信ティックをキューに入れる前に、銘柄ごとのポリシーで間引く::
+
+    conflator = TickConflator(pipeline.put_tick, {"USDCNY Curncy": "last:1"})
+    conflator.on_tick(security, epoch, price, fields)
+    conflator.flush(time.time())   # 窓が閉じた銘柄の保留分を送る
+
+ポリシーは文字列で指定する:
+
+- ``raw``: 全ティックをそのまま渡す（記録用）
+- ``interval:N``: Bloomberg のサーバー側コンフレーション（購読オプション ``interval=N``）。
+  受信側では間引かない（サーバー側が無いデモ・ソークテストでは ``last:N`` と同じ扱い）
+- ``last:N``: N秒ごとに最新値だけを渡す。窓内の出来高（SIZE_LAST_TRADE）は合計する
+- ``ohlc:N``: N秒ごとに始値・高値・安値・終値のティック（最大4件、発生順）を渡す。
+  窓内の出来高は終値のティックにまとめ、他のティックの出来高は0とする
+
+窓は時刻を N 秒で割り切った区間で、次の窓のティックが来た時か flush() で送る。
+"""
+import collections
+import threading
+
+POLICY_MODES = ("raw", "interval", "last", "ohlc")
+
+DeliveryPolicy = collections.namedtuple("DeliveryPolicy", ["mode", "seconds"])
+RAW = DeliveryPolicy("raw", 0.0)
+
+
+class DeliveryPolicyError(ValueError):
+    """配信ポリシーの指定エラー"""
+
+
+def parse_policy(text):
+    """"last:1" などの文字列（または DeliveryPolicy）をポリシーに変換"""
+    if isinstance(text, DeliveryPolicy):
+        return text
+    mode, _, seconds = str(text).strip().partition(":")
+    mode = mode.strip().lower()
+    if mode not in POLICY_MODES:
+        raise DeliveryPolicyError(f"{text}: unknown delivery mode (use {', '.join(POLICY_MODES)})")
+    if mode == "raw":
+        if seconds.strip():
+            raise DeliveryPolicyError(f"{text}: raw takes no interval")
+        return RAW
+    try:
+        seconds = float(seconds)
+    except ValueError:
+        raise DeliveryPolicyError(f"{text}: interval must be a number of seconds") from None
+    if not seconds > 0:
+        raise DeliveryPolicyError(f"{text}: interval must be positive")
+    return DeliveryPolicy(mode, seconds)
+
+
+def format_policy(policy):
+    return policy.mode if policy.mode == "raw" else f"{policy.mode}:{policy.seconds:g}"
+
+
+def subscription_options(policy):
+    """購読オプション文字列（サーバー側コンフレーションのみ）"""
+    # format_policy と同じ表記（丸めると画面の表示や再購読の判定とずれる）
+    return f"interval={policy.seconds:g}" if policy.mode == "interval" else ""
+
+
+class TickConflator:
+    """フィードスレッドで銘柄ごとの配信ポリシーを適用する
+
+    emit(security, epoch, price, fields) は受信したスレッドから呼ばれる。
+    ポリシーは UI スレッドから実行中に変更できる。
+    """
+
+    def __init__(self, emit, policies=None, default=RAW, server_side=True):
+        self.emit = emit
+        self.default = parse_policy(default)
+        # サーバー側コンフレーションが無い場合、interval は last と同様に受信側で間引く
+        self.server_side = server_side
+        self._policies = {security: parse_policy(policy)
+                          for security, policy in (policies or {}).items()}
+        # 銘柄 -> 作成中の窓 {"end", "ticks", "volume"}
+        self._pending = {}
+        self._lock = threading.Lock()
+        # 銘柄ごとの受信・送信ティック数
+        self.received = collections.Counter()
+        self.delivered = collections.Counter()
+
+    def policy(self, security):
+        return self._policies.get(security, self.default)
+
+    def set_policy(self, security, policy):
+        """ポリシーを変更。購読オプションの変更（再購読）が必要な場合 True"""
+        policy = parse_policy(policy)
+        with self._lock:
+            previous = self.policy(security)
+            # 旧ポリシーで保留中の分は送ってから切り替える
+            ready = self._take(security)
+            self._policies[security] = policy
+        self._deliver(security, ready)
+        return subscription_options(previous) != subscription_options(policy)
+
+    def _window(self, policy):
+        """受信側で間引く窓の秒数（間引かない場合 None）"""
+        if policy.mode == "raw" or (policy.mode == "interval" and self.server_side):
+            return None
+        return policy.seconds
+
+    def on_tick(self, security, epoch, price, fields=None):
+        with self._lock:
+            self.received[security] += 1
+            policy = self.policy(security)
+            seconds = self._window(policy)
+            if seconds is None:
+                ready = [(epoch, price, fields)]
+                self.delivered[security] += 1
+            else:
+                ready = self._add(security, policy, seconds, epoch, price, fields)
+        self._deliver(security, ready)
+
+    def _add(self, security, policy, seconds, epoch, price, fields):
+        ready = []
+        window = self._pending.get(security)
+        if window is not None and epoch >= window["end"]:
+            ready = self._take(security)
+            window = None
+        if window is None:
+            window = self._pending[security] = {
+                "end": epoch - epoch % seconds + seconds, "ticks": {}, "volume": 0.0}
+
+        tick = (epoch, price, fields)
+        volume = (fields or {}).get("SIZE_LAST_TRADE", 0.0)
+        if volume > 0:
+            window["volume"] += volume
+        ticks = window["ticks"]
+        if policy.mode == "ohlc":
+            ticks.setdefault("open", tick)
+            if "high" not in ticks or price > ticks["high"][1]:
+                ticks["high"] = tick
+            if "low" not in ticks or price < ticks["low"][1]:
+                ticks["low"] = tick
+        ticks["close"] = tick
+        return ready
+
+    def _take(self, security):
+        """保留中の窓を送信するティックのリストにして取り出す（_lock を保持して呼ぶ）"""
+        window = self._pending.pop(security, None)
+        if window is None:
+            return []
+        # 始値・高値・安値・終値の重複を除いて発生順に並べる
+        unique = {id(tick): tick for tick in window["ticks"].values()}
+        ticks = sorted(unique.values(), key=lambda tick: tick[0])
+        if window["volume"] > 0:
+            epoch, price, fields = ticks[-1]
+            ticks[-1] = (epoch, price, dict(fields or {}, SIZE_LAST_TRADE=window["volume"]))
+            # 他のティックは出来高0と明示する（欠損扱いで VWAP に重みが付かないように）
+            for i, (epoch, price, fields) in enumerate(ticks[:-1]):
+                ticks[i] = (epoch, price, dict(fields or {}, SIZE_LAST_TRADE=0.0))
+        self.delivered[security] += len(ticks)
+        return ticks
+
+    def flush(self, now=None):
+        """窓が閉じた（now 以前に終わった）保留分を送る。now=None なら全て"""
+        ready = {}
+        with self._lock:
+            for security, window in list(self._pending.items()):
+                if now is None or now >= window["end"]:
+                    ready[security] = self._take(security)
+        for security, ticks in ready.items():
+            self._deliver(security, ticks)
+
+    def _deliver(self, security, ticks):
+        # 送信数は取り出した時点で _lock 内で数えている
+        for epoch, price, fields in ticks:
+            self.emit(security, epoch, price, fields)
@@ -0,0 +1,222 @@
+"""派生銘柄エンジン
+
+購読中の銘柄を使った式（スプレッド、カーブ、裁定）を派生銘柄として定義し、
+入力銘柄がティックした時だけ依存グラフに沿って再計算する。
+
+式の中では銘柄名を波括弧で囲んで参照する::
+
+    engine = DerivedSeriesEngine()
+    engine.define("LME Cash-3M", "{LMCADS00 Comdty} - {LMCADS03 Comdty}")
+    engine.on_tick("LMCADS00 Comdty", 8480.0)   # -> []（3Mがまだ無い）
+    engine.on_tick("LMCADS03 Comdty", 8500.0)   # -> [("LME Cash-3M", -20.0)]
+
+同時刻に複数の入力がティックする場合は mark() で入力を反映してから evaluate() を
+1回呼ぶと、各派生銘柄を1回だけ計算する（片方の入力だけ新しい中間値を出さない）::
+
+    engine.mark("LMCADS00 Comdty", 8490.0)
+    engine.mark("LMCADS03 Comdty", 8510.0)
+    engine.evaluate()                           # -> [("LME Cash-3M", -20.0)]
+
+派生銘柄は別の派生銘柄を参照できる（循環参照はエラー）。
+"""
+import ast
+import math
+import re
+
+# 式中の銘柄参照 {SECURITY NAME}
+_REF_PATTERN = re.compile(r"\{([^{}]+)\}")
+
+# 式で使用可能な構文（四則演算・べき乗・定数・一部の組み込み関数のみ）
+_ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Load,
+    ast.Constant, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow,
+    ast.USub, ast.UAdd,
+)
+_ALLOWED_FUNCS = {"abs": abs, "min": min, "max": max}
+# 関数ごとの引数の数（最小, 最大。None は上限なし）
+_FUNC_ARITY = {"abs": (1, 1), "min": (2, None), "max": (2, None)}
+
+
+class DerivedSeriesError(ValueError):
+    """派生銘柄の定義エラー"""
+
+
+class DerivedSeriesEngine:
+    def __init__(self):
+        # 派生銘柄名 -> (評価関数, 参照名リスト)
+        self._nodes = {}
+        # 派生銘柄名 -> 元の式（表示用）
+        self._expressions = {}
+        # 銘柄名 -> 最新値（実銘柄・派生銘柄とも）
+        self._values = {}
+        # 入力名 -> そのティックで再計算する派生銘柄（トポロジカル順）
+        self._plan = {}
+        # 派生銘柄名 -> トポロジカル順の順位
+        self._rank = {}
+        # 再計算待ちの派生銘柄
+        self._dirty = set()
+
+    def define(self, name, expression):
+        """派生銘柄を定義（同名があれば置き換え）"""
+        refs = list(dict.fromkeys(_REF_PATTERN.findall(expression)))
+        if not refs:
+            raise DerivedSeriesError(f"{name}: expression references no securities")
+        if name in refs:
+            raise DerivedSeriesError(f"{name}: expression references itself")
+
+        # {SECURITY} を位置引数 _0, _1, ... に置き換えて関数化
+        arg_names = {ref: f"_{i}" for i, ref in enumerate(refs)}
+        source = _REF_PATTERN.sub(lambda m: arg_names[m.group(1)], expression)
+        try:
+            tree = ast.parse(source, mode="eval")
+        except SyntaxError as e:
+            raise DerivedSeriesError(f"{name}: invalid expression: {e.msg}") from None
+        for node in ast.walk(tree):
+            if not isinstance(node, _ALLOWED_NODES):
+                raise DerivedSeriesError(
+                    f"{name}: unsupported syntax '{type(node).__name__}'")
+            if isinstance(node, ast.Call) and not (
+                    isinstance(node.func, ast.Name) and node.func.id in _ALLOWED_FUNCS):
+                raise DerivedSeriesError(f"{name}: only abs/min/max calls are allowed")
+            if isinstance(node, ast.Call):
+                low, high = _FUNC_ARITY[node.func.id]
+                count = len(node.args)
+                if count < low or (high is not None and count > high):
+                    expected = f"{low}" if low == high else f"at least {low}"
+                    raise DerivedSeriesError(
+                        f"{name}: {node.func.id}() takes {expected} argument(s), got {count}")
+            if isinstance(node, ast.Constant) and (
+                    isinstance(node.value, bool) or not isinstance(node.value, (int, float))):
+                raise DerivedSeriesError(f"{name}: only numeric constants are allowed")
+            if isinstance(node, ast.Name) and node.id not in _ALLOWED_FUNCS \
+                    and node.id not in arg_names.values():
+                raise DerivedSeriesError(f"{name}: unknown name '{node.id}'")
+
+        code = compile(f"lambda {', '.join(arg_names.values())}: {source}",
+                       f"<derived {name}>", "eval")
+        func = eval(code, {"__builtins__": {}, **_ALLOWED_FUNCS})
+
+        previous = self._nodes.get(name)
+        previous_expression = self._expressions.get(name)
+        self._nodes[name] = (func, refs)
+        self._expressions[name] = expression
+        try:
+            self._rebuild_plan()
+        except DerivedSeriesError:
+            # 循環参照の場合は定義を元に戻す
+            if previous is None:
+                del self._nodes[name]
+                del self._expressions[name]
+            else:
+                self._nodes[name] = previous
+                self._expressions[name] = previous_expression
+            self._rebuild_plan()
+            raise
+        self._values.pop(name, None)
+
+    def remove(self, name):
+        """派生銘柄の定義を削除"""
+        if name not in self._nodes:
+            return
+        dependents = [n for n, (_, refs) in self._nodes.items() if name in refs]
+        if dependents:
+            raise DerivedSeriesError(
+                f"{name}: still referenced by {', '.join(dependents)}")
+        del self._nodes[name]
+        del self._expressions[name]
+        self._values.pop(name, None)
+        self._rebuild_plan()
+
+    def names(self):
+        """定義済みの派生銘柄名"""
+        return list(self._nodes)
+
+    def expression(self, name):
+        return self._expressions[name]
+
+    def inputs(self):
+        """購読が必要な実銘柄（派生銘柄以外の参照先）"""
+        return sorted({ref for _, refs in self._nodes.values()
+                       for ref in refs if ref not in self._nodes})
+
+    def on_tick(self, security, value):
+        """入力ティックを反映し、更新された派生銘柄の (名前, 値) リストを返す"""
+        self.mark(security, value)
+        return self.evaluate()
+
+    def mark(self, security, value):
+        """入力の値を反映し、依存する派生銘柄を再計算待ちにする"""
+        self._values[security] = value
+        plan = self._plan.get(security)
+        if plan:
+            self._dirty.update(plan)
+
+    def evaluate(self):
+        """再計算待ちの派生銘柄を依存順に1回ずつ計算し、(名前, 値) リストを返す"""
+        if not self._dirty:
+            return []
+        plan = sorted((name for name in self._dirty if name in self._nodes),
+                      key=self._rank.__getitem__)
+        self._dirty.clear()
+
+        values = self._values
+        updated = []
+        for name in plan:
+            func, refs = self._nodes[name]
+            try:
+                args = [values[ref] for ref in refs]
+            except KeyError:
+                # 入力がまだ揃っていない
+                continue
+            try:
+                # 負数の非整数乗は複素数になり float() が TypeError を送出する
+                result = float(func(*args))
+            except (ArithmeticError, ValueError, TypeError):
+                continue
+            if not math.isfinite(result):
+                continue
+            values[name] = result
+            updated.append((name, result))
+        return updated
+
+    def _rebuild_plan(self):
+        """依存グラフをトポロジカルソートし、入力ごとの再計算順を作り直す"""
+        order = []
+        state = {}  # name -> 1: 探索中, 2: 完了
+
+        def visit(name, path):
+            if state.get(name) == 2:
+                return
+            if state.get(name) == 1:
+                cycle = " -> ".join(path + [name])
+                raise DerivedSeriesError(f"circular reference: {cycle}")
+            state[name] = 1
+            for ref in self._nodes[name][1]:
+                if ref in self._nodes:
+                    visit(ref, path + [name])
+            state[name] = 2
+            order.append(name)
+
+        for name in self._nodes:
+            visit(name, [])
+
+        # 逆依存（参照先 -> 参照元）
+        dependents = {}
+        for name, (_, refs) in self._nodes.items():
+            for ref in refs:
+                dependents.setdefault(ref, set()).add(name)
+
+        rank = {name: i for i, name in enumerate(order)}
+        plan = {}
+        for source in dependents:
+            reached = set()
+            stack = list(dependents[source])
+            while stack:
+                name = stack.pop()
+                if name in reached:
+                    continue
+                reached.add(name)
+                stack.extend(dependents.get(name, ()))
+            plan[source] = sorted(reached, key=rank.__getitem__)
+        self._plan = plan
+        self._rank = rank
@@ -0,0 +1,325 @@
+"""テクニカル指標（EMA・ボリンジャーバンド・RSI・VWAPバンド）
+
+各指標はティックごとに O(1) で更新する update() と、バックフィルや
+リプレイ用にNumPyでまとめて計算する batch() を持つ。batch() は
+update() を同じ順に呼んだ場合と同じ値を返し、内部状態もその時点まで進める。
+
+IndicatorSet は銘柄ごとに指標値をティックと同じ行順で保持する::
+
+    indicators = IndicatorSet([EMA(20), Bollinger(20), RSI(14), VWAP()])
+    indicators.update(epoch, price, volume)
+    indicators.last(100)["EMA20"]
+"""
+import collections
+import math
+
+import numpy as np
+
+from tickstore import TickBuffer, next_midnight
+
+NAN = float("nan")
+
+
+def _ema_batch(values, alpha, previous):
+    """EMA（y[i] = y[i-1] + alpha * (x[i] - y[i-1])）のベクトル化計算
+
+    previous が NaN の場合は最初の値で初期化する。
+    EMAは値の平行移動に対して不変なので previous からの差で計算し、
+    減衰係数のべき乗と差の大きさの積がオーバーフローしない長さのブロックごとに閉形式で計算する。
+    """
+    values = np.asarray(values, dtype=float)
+    result = np.empty_like(values)
+    if not len(values):
+        return result
+    decay = 1.0 - alpha
+    if decay <= 0.0:
+        result[:] = values
+        return result
+    position = 0
+    if math.isnan(previous):
+        previous = values[0]
+        result[0] = previous
+        position = 1
+    if position == len(values):
+        return result
+    scale = float(np.max(np.abs(values[position:] - previous)))
+    headroom = 300 - (math.log10(scale) if scale > 1.0 else 0.0)
+    block = max(1, min(len(values), int(headroom / -math.log10(decay))))
+    while position < len(values):
+        chunk = values[position:position + block] - previous
+        n = len(chunk)
+        powers = decay ** np.arange(n)
+        # y[j] - prev = alpha * decay^j * sum_{i<=j} (x[i] - prev) / decay^i
+        result[position:position + n] = previous + alpha * powers * np.cumsum(chunk / powers)
+        previous = result[position + n - 1]
+        position += n
+    return result
+
+
+class EMA:
+    """指数移動平均（alpha = 2 / (period + 1)、最初の値で初期化）"""
+
+    def __init__(self, period=20):
+        self.period = period
+        self.alpha = 2.0 / (period + 1)
+        self.columns = (f"EMA{period}",)
+        self._value = NAN
+
+    def update(self, epoch, price, volume):
+        if math.isnan(self._value):
+            self._value = price
+        else:
+            self._value += self.alpha * (price - self._value)
+        return (self._value,)
+
+    def batch(self, times, prices, volumes):
+        result = _ema_batch(prices, self.alpha, self._value)
+        if len(result):
+            self._value = result[-1]
+        return (result,)
+
+
+class Bollinger:
+    """ボリンジャーバンド（period 件の移動平均 ± width × 標準偏差）"""
+
+    def __init__(self, period=20, width=2.0):
+        self.period = period
+        self.width = width
+        self.columns = (f"BB{period}_upper", f"BB{period}_mid", f"BB{period}_lower")
+        self._window = collections.deque()
+        # 桁落ちを抑えるため基準値からの差で合計を持つ
+        self._reference = NAN
+        self._sum = 0.0
+        self._sum_sq = 0.0
+
+    def update(self, epoch, price, volume):
+        if math.isnan(self._reference):
+            self._reference = price
+        x = price - self._reference
+        self._window.append(x)
+        self._sum += x
+        self._sum_sq += x * x
+        if len(self._window) > self.period:
+            old = self._window.popleft()
+            self._sum -= old
+            self._sum_sq -= old * old
+        if len(self._window) < self.period:
+            return (NAN, NAN, NAN)
+        mean = self._sum / self.period
+        std = math.sqrt(max(self._sum_sq / self.period - mean * mean, 0.0))
+        mid = mean + self._reference
+        return (mid + self.width * std, mid, mid - self.width * std)
+
+    def batch(self, times, prices, volumes):
+        prices = np.asarray(prices, dtype=float)
+        if not len(prices):
+            return (prices.copy(), prices.copy(), prices.copy())
+        if math.isnan(self._reference):
+            self._reference = prices[0]
+        # 前回までのウィンドウと連結して移動合計を計算
+        previous = np.fromiter(self._window, dtype=float, count=len(self._window))
+        x = np.concatenate([previous, prices - self._reference])
+        sums = np.concatenate([[0.0], np.cumsum(x)])
+        sums_sq = np.concatenate([[0.0], np.cumsum(x * x)])
+        end = np.arange(len(previous) + 1, len(x) + 1)
+        start = np.maximum(end - self.period, 0)
+        count = end - start
+        window_sum = sums[end] - sums[start]
+        window_sum_sq = sums_sq[end] - sums_sq[start]
+        mean = window_sum / count
+        std = np.sqrt(np.maximum(window_sum_sq / count - mean * mean, 0.0))
+        mid = mean + self._reference
+        upper = mid + self.width * std
+        lower = mid - self.width * std
+        partial = count < self.period
+        for column in (upper, mid, lower):
+            column[partial] = np.nan
+
+        tail = x[-self.period:]
+        self._window = collections.deque(tail.tolist())
+        self._sum = float(tail.sum())
+        self._sum_sq = float((tail * tail).sum())
+        return (upper, mid, lower)
+
+
+class RSI:
+    """RSI（ワイルダー平滑化 = alpha 1/period のEMA、period 回の変化までは NaN）"""
+
+    def __init__(self, period=14):
+        self.period = period
+        self.alpha = 1.0 / period
+        self.columns = (f"RSI{period}",)
+        self._last = NAN
+        self._gain = NAN
+        self._loss = NAN
+        self._changes = 0
+
+    def update(self, epoch, price, volume):
+        if math.isnan(self._last):
+            self._last = price
+            return (NAN,)
+        change = price - self._last
+        self._last = price
+        gain, loss = max(change, 0.0), max(-change, 0.0)
+        if math.isnan(self._gain):
+            self._gain, self._loss = gain, loss
+        else:
+            self._gain += self.alpha * (gain - self._gain)
+            self._loss += self.alpha * (loss - self._loss)
+        self._changes += 1
+        if self._changes < self.period:
+            return (NAN,)
+        return (self._rsi(self._gain, self._loss),)
+
+    @staticmethod
+    def _rsi(gain, loss):
+        total = gain + loss
+        return 100.0 * gain / total if total > 0 else 50.0
+
+    def batch(self, times, prices, volumes):
+        prices = np.asarray(prices, dtype=float)
+        result = np.full(len(prices), np.nan)
+        if not len(prices):
+            return (result,)
+        first = 0
+        if math.isnan(self._last):
+            self._last = prices[0]
+            first = 1
+        changes = np.diff(np.concatenate([[self._last], prices[first:]]))
+        if not len(changes):
+            return (result,)
+        gains = _ema_batch(np.maximum(changes, 0.0), self.alpha, self._gain)
+        losses = _ema_batch(np.maximum(-changes, 0.0), self.alpha, self._loss)
+        total = gains + losses
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rsi = np.where(total > 0, 100.0 * gains / total, 50.0)
+        counts = self._changes + np.arange(1, len(changes) + 1)
+        rsi[counts < self.period] = np.nan
+        result[first:] = rsi
+
+        self._last = prices[-1]
+        self._gain, self._loss = gains[-1], losses[-1]
+        self._changes = int(counts[-1])
+        return (result,)
+
+
+class VWAP:
+    """出来高加重平均価格と ± width × 出来高加重標準偏差のバンド
+
+    日付（ローカル時刻）が変わるとリセットする。出来高が無い（NaN の）ティック
+    （派生銘柄など）は出来高1として扱い、出来高0のティックは重みを持たない。
+    累積出来高が0の間はその時点の価格を返す。
+    """
+
+    def __init__(self, width=2.0):
+        self.width = width
+        self.columns = ("VWAP", "VWAP_upper", "VWAP_lower")
+        self._reset(NAN)
+
+    def _reset(self, epoch):
+        self._session_end = (NAN if math.isnan(epoch) else next_midnight(epoch))
+        self._reference = NAN
+        self._volume = 0.0
+        self._pv = 0.0
+        self._pv_sq = 0.0
+
+    def update(self, epoch, price, volume):
+        if not epoch < self._session_end:
+            self._reset(epoch)
+        if math.isnan(self._reference):
+            self._reference = price
+        if math.isnan(volume):
+            volume = 1.0
+        elif volume < 0:
+            volume = 0.0
+        x = price - self._reference
+        self._volume += volume
+        self._pv += volume * x
+        self._pv_sq += volume * x * x
+        if not self._volume > 0:
+            return (price, price, price)
+        mean = self._pv / self._volume
+        std = math.sqrt(max(self._pv_sq / self._volume - mean * mean, 0.0))
+        vwap = mean + self._reference
+        return (vwap, vwap + self.width * std, vwap - self.width * std)
+
+    def batch(self, times, prices, volumes):
+        times = np.asarray(times, dtype=float)
+        prices = np.asarray(prices, dtype=float)
+        volumes = np.asarray(volumes, dtype=float)
+        columns = tuple(np.empty(len(prices)) for _ in self.columns)
+        position = 0
+        while position < len(prices):
+            # 日付が変わる位置で区切って累積
+            if not times[position] < self._session_end:
+                self._reset(times[position])
+            end = int(np.searchsorted(times, self._session_end, side="left"))
+            end = max(end, position + 1)
+            p = prices[position:end]
+            v = volumes[position:end]
+            v = np.where(np.isnan(v), 1.0, np.maximum(v, 0.0))
+            if math.isnan(self._reference):
+                self._reference = p[0]
+            x = p - self._reference
+            cum_v = self._volume + np.cumsum(v)
+            cum_pv = self._pv + np.cumsum(v * x)
+            cum_pv_sq = self._pv_sq + np.cumsum(v * x * x)
+            # 累積出来高が0の間はその時点の価格
+            weighted = cum_v > 0
+            safe_v = np.where(weighted, cum_v, 1.0)
+            mean = np.where(weighted, cum_pv / safe_v, x)
+            std = np.where(weighted,
+                           np.sqrt(np.maximum(cum_pv_sq / safe_v - mean * mean, 0.0)), 0.0)
+            vwap = mean + self._reference
+            columns[0][position:end] = vwap
+            columns[1][position:end] = vwap + self.width * std
+            columns[2][position:end] = vwap - self.width * std
+            self._volume, self._pv, self._pv_sq = cum_v[-1], cum_pv[-1], cum_pv_sq[-1]
+            position = end
+        return columns
+
+
+def default_indicators():
+    """チャートに重ねる標準の指標セット"""
+    return [EMA(20), Bollinger(20, 2.0), RSI(14), VWAP(2.0)]
+
+
+class IndicatorSet:
+    """1銘柄分の指標値をティックと同じ行順で保持する"""
+
+    def __init__(self, indicators=None, max_rows=None):
+        self.indicators = indicators if indicators is not None else default_indicators()
+        self.columns = tuple(column for indicator in self.indicators
+                             for column in indicator.columns)
+        self._buffer = TickBuffer(
+            np.dtype([("time", "<f8")] + [(column, "<f8") for column in self.columns]),
+            max_rows=max_rows)
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def update(self, epoch, price, volume=NAN):
+        """1ティック分を O(1) で更新"""
+        row = [epoch]
+        for indicator in self.indicators:
+            row.extend(indicator.update(epoch, price, volume))
+        self._buffer.append_row(tuple(row))
+
+    def batch(self, times, prices, volumes=None):
+        """複数ティックをまとめて計算（バックフィル・リプレイ用）"""
+        times = np.asarray(times, dtype=float)
+        if volumes is None:
+            volumes = np.full(len(times), np.nan)
+        records = np.empty(len(times), dtype=self._buffer.dtype)
+        records["time"] = times
+        for indicator in self.indicators:
+            for column, values in zip(indicator.columns,
+                                      indicator.batch(times, prices, volumes)):
+                records[column] = values
+        self._buffer.extend(records)
+
+    def last(self, count, columns=None):
+        """直近 count 件の指標値（列ビューの辞書）"""
+        records = self._buffer.records()
+        records = records[max(len(records) - count, 0):]
+        return {column: records[column] for column in ("time",) + tuple(columns or self.columns)}
@@ -7,38 +7,452 @@ import matplotlib.dates as mdates
 import threading
 import queue
 import datetime
+import logging
 import time
 import numpy as np
 
+from matplotlib.collections import PolyCollection
+
+from bars import BarSeries
+from dashboard import DASHBOARD_LAYOUT, RenderScheduler, create_panel
+from delivery import (DeliveryPolicyError, TickConflator, format_policy,
+                      subscription_options)
+from derived import DerivedSeriesEngine
+from indicators import IndicatorSet
+from tickstore import (TickArchive, TickStore, TickStoreError, TICK_DIRECTORY,
+                       TICK_FIELDS, to_epoch)
+
+logger = logging.getLogger("lme_monitor")
+
 try:
     import blpapi
     BLPAPI_AVAILABLE = True
 except ImportError:
     BLPAPI_AVAILABLE = False
-    print("Warning: Bloomberg API not available. Using demo mode.")
+    logger.warning("Bloomberg API not available. Using demo mode.")
+
+# 監視銘柄（先頭がデフォルト表示）
+SECURITIES = [
+    "LMCADS03 Comdty",  # LME Copper 3-month
+    "LMCADS00 Comdty",  # LME Copper Cash
+    "HG1 Comdty",       # COMEX Copper (USc/lb)
+    "CU1 Comdty",       # SHFE Copper (CNY/t)
+    "USDCNY Curncy",
+]
+
+# 派生銘柄（名前: 式）。式中の {銘柄} は購読中の銘柄または他の派生銘柄
+DERIVED_SERIES = {
+    "LME Cash-3M": "{LMCADS00 Comdty} - {LMCADS03 Comdty}",
+    # COMEX USc/lb -> USD/t (2204.62 lb/t / 100)
+    "LME 3M vs COMEX": "{LMCADS03 Comdty} - {HG1 Comdty} * 22.0462",
+    # SHFE価格 - LME 3M x USDCNY x 増値税13%
+    "SHFE Import Arb": "{CU1 Comdty} - {LMCADS03 Comdty} * {USDCNY Curncy} * 1.13",
+}
+
+# 銘柄ごとの配信ポリシー（指定の無い銘柄は DEFAULT_DELIVERY_POLICY、画面から変更可）
+#   raw: 全ティック / interval:N: サーバー側でN秒ごとに間引き
+#   last:N: N秒ごとの最新値 / ohlc:N: N秒ごとの始値・高値・安値・終値
+DEFAULT_DELIVERY_POLICY = "raw"
+DELIVERY_POLICIES = {
+    "USDCNY Curncy": "interval:1",  # 裁定計算の入力のみ
+}
+
+# デモモードの初期価格
+DEMO_BASE_PRICES = {
+    "LMCADS03 Comdty": 8500.0,
+    "LMCADS00 Comdty": 8480.0,
+    "HG1 Comdty": 385.0,
+    "CU1 Comdty": 68500.0,
+    "USDCNY Curncy": 7.20,
+}
+
+# チャートに表示する直近のティック数
+CHART_POINTS = 100
+
+# チャートに重ねる指標（表示名: [(列名, 色, 線種), ...]）。RSIは右側の軸に表示
+CHART_OVERLAYS = {
+    "EMA": [("EMA20", '#FF9800', '-')],
+    "Bollinger": [("BB20_upper", '#4a9eff', '--'),
+                  ("BB20_mid", '#4a9eff', ':'),
+                  ("BB20_lower", '#4a9eff', '--')],
+    "VWAP": [("VWAP", '#e040fb', '-'),
+             ("VWAP_upper", '#e040fb', ':'),
+             ("VWAP_lower", '#e040fb', ':')],
+    "RSI": [("RSI14", '#ffeb3b', '-')],
+}
+
+# ダッシュボードの足の間隔（秒）
+BAR_INTERVAL = 10
+
+# スレッド間キューの上限（溢れた場合は古いものから捨てる）
+DATA_QUEUE_SIZE = 10000
+NEWS_QUEUE_SIZE = 1000
 
+# ニュース欄に残す行数
+MAX_NEWS_LINES = 500
+
+def put_latest(target_queue, item):
+    """上限付きキューに追加。満杯なら最も古い要素を捨てる（捨てた要素のリストを返す）"""
+    try:
+        target_queue.put_nowait(item)
+        return []
+    except queue.Full:
+        pass
+    dropped = []
+    try:
+        dropped.append(target_queue.get_nowait())
+    except queue.Empty:
+        pass
+    try:
+        target_queue.put_nowait(item)
+    except queue.Full:
+        dropped.append(item)
+    return dropped
+
+class MarketDataPipeline:
+    """受信ティックの保存・派生銘柄・指標の計算（UIに依存しない処理）"""
+    
+    def __init__(self, tick_directory=TICK_DIRECTORY, max_memory_rows=200_000):
+        # データ格納用（銘柄ごとのティック。tick_directory 以下にも保存）
+        self.tick_directory = tick_directory
+        self.tick_store = TickStore(tick_directory, max_memory_rows=max_memory_rows)
+        # 銘柄ごとのテクニカル指標（ティックと同じ行順）
+        self.indicators = {}
+        # 銘柄ごとの足（BAR_INTERVAL 秒）
+        self.bars = {}
+        # 銘柄ごとの更新回数と最新ティック時刻（ダッシュボードの再描画判定用）
+        self.versions = {}
+        self.latest_epoch = None
+        
+        # 派生銘柄エンジン
+        self.derived_engine = DerivedSeriesEngine()
+        for name, expression in DERIVED_SERIES.items():
+            self.derived_engine.define(name, expression)
+        self.securities = list(dict.fromkeys(SECURITIES + self.derived_engine.inputs()))
+        
+        # キューでスレッド間通信
+        self.data_queue = queue.Queue(maxsize=DATA_QUEUE_SIZE)
+        self.news_queue = queue.Queue(maxsize=NEWS_QUEUE_SIZE)
+        # キューが溢れて捨てた件数（価格ティック / ニュース）
+        self.dropped_ticks = 0
+        self.dropped_news = 0
+        
+    def put_data(self, data_type, data):
+        """フィードスレッドからのデータをキューに追加"""
+        for dropped_type, dropped in put_latest(self.data_queue, (data_type, data)):
+            if dropped_type == "price":
+                self.dropped_ticks += 1
+            else:
+                logger.warning(f"Queue full: dropped {dropped_type} message: {dropped}")
+            
+    def put_tick(self, security, epoch, price, fields=None):
+        """フィードスレッドからの価格ティックをキューに追加"""
+        self.put_data("price", {"security": security, "price": price, "time": epoch,
+                                "fields": fields})
+            
+    def put_news(self, news):
+        self.dropped_news += len(put_latest(self.news_queue, news))
+            
+    def process_data_queue(self):
+        """キューに溜まったティックを処理し、エラーメッセージのリストを返す"""
+        errors = []
+        # 派生銘柄は同時刻の入力をまとめて反映してから1回だけ計算する
+        # （片方の入力だけ新しい、実在しない中間値を出さない）
+        derived_time = None
+        # 処理中に追加された分は次回に回す（高頻度時に抜けられなくなるのを防ぐ）
+        for _ in range(self.data_queue.qsize()):
+            try:
+                data_type, data = self.data_queue.get_nowait()
+            except queue.Empty:
+                break
+            
+            if data_type == "price":
+                epoch = to_epoch(data["time"])
+                if derived_time is not None and epoch != derived_time:
+                    self.append_derived(derived_time)
+                self.append_price(data["security"], data["price"], epoch, data.get("fields"))
+                
+                # 入力がティックした派生銘柄のみ再計算待ちにする
+                self.derived_engine.mark(data["security"], data["price"])
+                derived_time = epoch
+                    
+            elif data_type == "error":
+                errors.append(data)
+        if derived_time is not None:
+            self.append_derived(derived_time)
+        return errors
+        
+    def append_derived(self, epoch):
+        """再計算待ちの派生銘柄を計算して追加"""
+        for name, value in self.derived_engine.evaluate():
+            self.append_price(name, value, epoch)
+        
+    def has_ticks(self, security):
+        return len(self.tick_store.last(security, 1)["time"]) > 0
+        
+    def chart_data(self, security, count):
+        """チャート用の直近 count 件のティックと指標値"""
+        ticks = self.tick_store.last(security, count, ["LAST_PRICE"])
+        indicator_set = self.indicators.get(security)
+        values = indicator_set.last(len(ticks["time"])) if indicator_set else {}
+        return ticks, values
+        
+    def append_price(self, security, price, timestamp, fields=None):
+        """銘柄のティックストアに価格を追加し、指標を更新（実銘柄・派生銘柄共通）"""
+        values = dict(fields) if fields else {}
+        values["LAST_PRICE"] = price
+        epoch = to_epoch(timestamp)
+        self.tick_store.append(security, epoch, values)
+        
+        indicator_set = self.indicators.get(security)
+        if indicator_set is None:
+            indicator_set = self.indicators[security] = IndicatorSet(
+                max_rows=self.tick_store.max_memory_rows)
+        volume = values.get("SIZE_LAST_TRADE", np.nan)
+        indicator_set.update(epoch, price, volume)
+        
+        bar_series = self.bars.get(security)
+        if bar_series is None:
+            bar_series = self.bars[security] = BarSeries(
+                BAR_INTERVAL, max_rows=self.tick_store.max_memory_rows)
+        bar_series.update(epoch, price, volume)
+        self._touch(security, epoch)
+        
+    def _touch(self, security, epoch):
+        self.versions[security] = self.versions.get(security, 0) + 1
+        if self.latest_epoch is None or epoch > self.latest_epoch:
+            self.latest_epoch = epoch
+        
+    def backfill_history(self):
+        """本日保存済みのティックを読み込み、指標をまとめて計算"""
+        if not self.tick_directory:
+            return
+        today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+        archive = TickArchive(self.tick_directory)
+        try:
+            for security in self.securities + self.derived_engine.names():
+                ticks = archive.query(security, start=today)
+                if not len(ticks["time"]):
+                    continue
+                self.tick_store.preload(security, ticks)
+                indicator_set = self.indicators[security] = IndicatorSet(
+                    max_rows=self.tick_store.max_memory_rows)
+                indicator_set.batch(ticks["time"], ticks["LAST_PRICE"],
+                                    ticks.get("SIZE_LAST_TRADE"))
+                bar_series = self.bars[security] = BarSeries(
+                    BAR_INTERVAL, max_rows=self.tick_store.max_memory_rows)
+                bar_series.batch(ticks["time"], ticks["LAST_PRICE"],
+                                 ticks.get("SIZE_LAST_TRADE"))
+                self._touch(security, float(ticks["time"][-1]))
+                # 派生銘柄の入力として最新値を反映
+                if security in self.securities:
+                    self.derived_engine.mark(security, float(ticks["LAST_PRICE"][-1]))
+        except (OSError, TickStoreError) as e:
+            logger.error(f"Error loading tick history: {e}")
+        # 派生銘柄の履歴は読み込み済みなので、最新値の計算結果は保存しない
+        self.derived_engine.evaluate()
+            
+class PriceChart:
+    """価格チャート（アーティストは一度だけ作成し、以降はデータのみ更新）
+    
+    canvas は FigureCanvasTkAgg（画面表示）または FigureCanvasAgg（ソークテスト）。
+    """
+    
+    def __init__(self, fig, canvas, overlay_visible):
+        self.fig = fig
+        self.canvas = canvas
+        self.ax = self.fig.add_subplot(111, facecolor='#1a1a1a')
+        self.overlay_visible = dict(overlay_visible)
+        self.setup()
+        
+    def setup(self):
+        # ダークテーマでチャートを設定
+        self.ax.set_title("LME Copper Price", color='white', fontsize=14, pad=20)
+        self.ax.set_xlabel("Time", color='white', fontsize=11)
+        self.ax.set_ylabel("Price (USD/ton)", color='white', fontsize=11)
+        
+        # グリッドの設定
+        self.ax.grid(True, alpha=0.2, color='#444444', linestyle='-', linewidth=0.5)
+        
+        # 軸の色を設定
+        self.ax.tick_params(colors='white', labelsize=9)
+        self.ax.tick_params(axis='x', labelrotation=45)
+        self.ax.spines['bottom'].set_color('#444444')
+        self.ax.spines['top'].set_color('#444444')
+        self.ax.spines['right'].set_color('#444444')
+        self.ax.spines['left'].set_color('#444444')
+        
+        # 背景色設定
+        self.ax.set_facecolor('#1a1a1a')
+        self.fig.patch.set_facecolor('#2d2d2d')
+        
+        # 軸の数値フォーマット（小数点桁数は価格変動に応じて update で切り替え）
+        self.price_decimals = 0
+        self.ax.yaxis.set_major_formatter(
+            plt.FuncFormatter(lambda x, p: f'${x:.{self.price_decimals}f}'))
+        self.ax.xaxis_date()
+        self.ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
+        self.ax.xaxis.set_major_locator(mdates.SecondLocator(interval=30))
+        now = datetime.datetime.now()
+        self.ax.set_xlim(mdates.date2num(now - datetime.timedelta(seconds=CHART_POINTS)),
+                         mdates.date2num(now))
+        
+        # RSIは右側の軸（0-100）に表示
+        self.rsi_ax = self.ax.twinx()
+        self.rsi_ax.set_ylim(0, 100)
+        self.rsi_ax.tick_params(colors='#888888', labelsize=8)
+        self.rsi_ax.set_ylabel("RSI", color='#888888', fontsize=9)
+        for level in (30, 70):
+            self.rsi_ax.axhline(level, color='#ffeb3b', alpha=0.15, linewidth=0.8)
+        self.rsi_ax.set_visible(self.overlay_visible["RSI"])
+        
+        # 価格ライン・塗りつぶし・最新価格は一度だけ作成し、以降はデータのみ更新
+        self.price_line, = self.ax.plot([], [], color='#00ff88', linewidth=2.5, alpha=0.9)
+        self.price_fill = PolyCollection([], alpha=0.2, facecolor='#00ff88', edgecolor='none')
+        self.ax.add_collection(self.price_fill)
+        
+        self.latest_halo, = self.ax.plot([], [], 'o', color='#ffff00', markersize=12, alpha=0.8)
+        self.latest_marker, = self.ax.plot([], [], 'o', color='#ff4444', markersize=8)
+        
+        # 価格ラベル（モダンスタイル）
+        self.latest_annotation = self.ax.annotate('', xy=(0, 0),
+                                                  xytext=(15, 15), textcoords='offset points',
+                                                  bbox=dict(boxstyle='round,pad=0.5', 
+                                                          facecolor='#4CAF50', 
+                                                          edgecolor='none',
+                                                          alpha=0.9),
+                                                  color='white',
+                                                  fontweight='bold',
+                                                  fontsize=11)
+        self.latest_annotation.set_visible(False)
+        
+        # 指標のオーバーレイ
+        self.overlay_lines = {}
+        for overlay, styles in CHART_OVERLAYS.items():
+            ax = self.rsi_ax if overlay == "RSI" else self.ax
+            lines = []
+            for column, color, linestyle in styles:
+                line, = ax.plot([], [], color=color, linestyle=linestyle,
+                                linewidth=1.2, alpha=0.8, label=column)
+                line.set_visible(self.overlay_visible[overlay])
+                lines.append((column, line))
+            self.overlay_lines[overlay] = lines
+        
+        self.canvas.draw()
+        
+    def set_overlay_visible(self, overlay, visible):
+        """指標オーバーレイの表示切り替え"""
+        self.overlay_visible[overlay] = visible
+        for _, line in self.overlay_lines[overlay]:
+            line.set_visible(visible)
+        if overlay == "RSI":
+            self.rsi_ax.set_visible(visible)
+            
+    def update(self, security, times, price_data, values):
+        """直近のティック（エポック秒・価格）と指標値でチャートを更新"""
+        timestamps = mdates.date2num([datetime.datetime.fromtimestamp(t) for t in times])
+        
+        # 価格ラインと塗りつぶし（アーティストは再作成せずデータのみ更新）
+        self.price_line.set_data(timestamps, price_data)
+        fill_x = np.concatenate([[timestamps[0]], timestamps, [timestamps[-1]]])
+        fill_y = np.concatenate([[0.0], price_data, [0.0]])
+        self.price_fill.set_verts([np.column_stack([fill_x, fill_y])])
+        
+        # 指標オーバーレイ（ティックと同じ行順で保持されている直近の値）
+        min_price = float(price_data.min())
+        max_price = float(price_data.max())
+        for overlay, lines in self.overlay_lines.items():
+            for column, line in lines:
+                column_values = values.get(column)
+                if column_values is None or len(column_values) != len(timestamps):
+                    line.set_data([], [])
+                    continue
+                line.set_data(timestamps, column_values)
+                # 表示中の価格軸の指標はY軸範囲に含める
+                if overlay != "RSI" and line.get_visible() and not np.isnan(column_values).all():
+                    min_price = min(min_price, float(np.nanmin(column_values)))
+                    max_price = max(max_price, float(np.nanmax(column_values)))
+        
+        # Y軸の自動スケーリング（価格変動を見やすくする）
+        price_range = max_price - min_price
+        
+        # 価格変動が小さい場合のマージン調整
+        if price_range < 10:  # 変動が10ドル未満の場合
+            margin = max(5, price_range * 0.1)  # 最小5ドルまたは変動の10%
+        else:
+            margin = price_range * 0.05  # 変動の5%
+        
+        # 軸の範囲を設定
+        self.ax.set_ylim(min_price - margin, max_price + margin)
+        if timestamps[-1] > timestamps[0]:
+            self.ax.set_xlim(timestamps[0], timestamps[-1])
+        
+        # 最新価格をハイライト
+        latest_price = float(price_data[-1])
+        latest_time = timestamps[-1]
+        self.latest_halo.set_data([latest_time], [latest_price])
+        self.latest_marker.set_data([latest_time], [latest_price])
+        self.latest_annotation.xy = (latest_time, latest_price)
+        self.latest_annotation.set_text(f'${latest_price:.2f}')
+        self.latest_annotation.set_visible(True)
+        
+        # タイトル（ダークテーマ）
+        self.ax.set_title(f"{security} - Real-Time Price Movement", 
+                         color='white', fontsize=12, pad=15)
+        
+        # 価格変動に応じて小数点桁数を調整
+        tick_range = float(price_data.max() - price_data.min())
+        if tick_range < 1:
+            # 変動が1ドル未満の場合、小数点以下3桁まで表示
+            self.price_decimals = 3
+        elif tick_range < 10:
+            # 変動が10ドル未満の場合、小数点以下2桁まで表示
+            self.price_decimals = 2
+        else:
+            # それ以上の場合は整数表示
+            self.price_decimals = 0
+        
+        self.fig.tight_layout()
+        self.canvas.draw()
+        
 class LMECopperMonitor:
     def __init__(self, root):
         self.root = root
         self.root.title("LME Copper Monitor - Bloomberg API")
         self.root.geometry("1200x800")
         
-        # データ格納用
-        self.price_data = []
-        self.timestamps = []
+        # ティック保存・派生銘柄・指標の処理（キューでスレッド間通信）
+        self.pipeline = MarketDataPipeline()
+        self.securities = self.pipeline.securities
         self.news_data = []
         
+        self.selected_security = tk.StringVar(value=self.securities[0])
+        self.overlay_vars = {overlay: tk.BooleanVar(value=overlay != "RSI")
+                             for overlay in CHART_OVERLAYS}
+        
+        # 銘柄ごとの配信ポリシー（フィードスレッドでキューに入れる前に間引く）
+        self.delivery = TickConflator(self.pipeline.put_tick, DELIVERY_POLICIES,
+                                      DEFAULT_DELIVERY_POLICY, server_side=BLPAPI_AVAILABLE)
+        self.delivery_var = tk.StringVar(
+            value=format_policy(self.delivery.policy(self.selected_security.get())))
+        
+        # 警告済みのキュー溢れ件数（価格ティック）
+        self.reported_drops = 0
+        
         # Bloomberg API関連
         self.session = None
+        self.correlation_ids = {}
         self.subscription_list = None
         self.news_session = None
         self.running = False
         
-        # キューでスレッド間通信
-        self.data_queue = queue.Queue()
-        self.news_queue = queue.Queue()
-        
         self.setup_ui()
+        
+        # 本日保存済みのティックを読み込む
+        self.pipeline.backfill_history()
+        if self.pipeline.has_ticks(self.selected_security.get()):
+            self.update_chart()
+            
         self.setup_bloomberg_connection()
         
     def setup_ui(self):
@@ -152,6 +566,15 @@ class LMECopperMonitor:
                               font=('Arial', 14, 'bold'))
         chart_title.pack(side=tk.LEFT)
         
+        # 表示銘柄の選択（実銘柄 + 派生銘柄）
+        security_selector = ttk.Combobox(chart_header,
+                                         textvariable=self.selected_security,
+                                         values=self.securities + self.pipeline.derived_engine.names(),
+                                         state='readonly',
+                                         width=22)
+        security_selector.pack(side=tk.LEFT, padx=(15, 0))
+        security_selector.bind('<<ComboboxSelected>>', self.on_security_selected)
+        
         # 現在価格表示
         self.price_label = tk.Label(chart_header,
                                    text="$0.00",
@@ -160,11 +583,59 @@ class LMECopperMonitor:
                                    font=('Arial', 16, 'bold'))
         self.price_label.pack(side=tk.RIGHT)
         
+        # 指標オーバーレイの表示切り替え
+        overlay_frame = tk.Frame(chart_card, bg='#2d2d2d')
+        overlay_frame.pack(fill=tk.X, padx=15, pady=(0, 5))
+        for overlay, var in self.overlay_vars.items():
+            tk.Checkbutton(overlay_frame, text=overlay, variable=var,
+                           command=self.on_overlay_toggled,
+                           bg='#2d2d2d', fg='#cccccc', selectcolor='#1a1a1a',
+                           activebackground='#2d2d2d', activeforeground='#ffffff',
+                           font=('Arial', 9)).pack(side=tk.LEFT, padx=(0, 10))
+        
+        # 表示銘柄の配信ポリシー（raw / interval:N / last:N / ohlc:N）
+        ttk.Button(overlay_frame, text="Apply", command=self.on_delivery_changed,
+                   width=6).pack(side=tk.RIGHT)
+        ttk.Combobox(overlay_frame, textvariable=self.delivery_var,
+                     values=["raw", "interval:1", "interval:5", "last:1", "last:5",
+                             "ohlc:10", "ohlc:60"],
+                     width=12).pack(side=tk.RIGHT, padx=(5, 5))
+        tk.Label(overlay_frame, text="Delivery:", bg='#2d2d2d', fg='#cccccc',
+                 font=('Arial', 9)).pack(side=tk.RIGHT)
+        
+        # タブ（単一チャート / ダッシュボード）
+        style.configure('Dark.TNotebook', background='#2d2d2d', borderwidth=0)
+        style.configure('Dark.TNotebook.Tab', background='#1a1a1a', foreground='#cccccc',
+                        padding=(12, 4))
+        style.map('Dark.TNotebook.Tab',
+                 background=[('selected', '#4a9eff')],
+                 foreground=[('selected', '#ffffff')])
+        self.chart_tabs = ttk.Notebook(chart_card, style='Dark.TNotebook')
+        self.chart_tabs.pack(fill=tk.BOTH, expand=True, padx=15, pady=(0, 15))
+        chart_tab = tk.Frame(self.chart_tabs, bg='#2d2d2d')
+        dashboard_tab = tk.Frame(self.chart_tabs, bg='#2d2d2d')
+        self.chart_tabs.add(chart_tab, text="Chart")
+        self.chart_tabs.add(dashboard_tab, text="Dashboard")
+        self.chart_tabs.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+        
         # Matplotlib図（ダークテーマ）
         self.fig = Figure(figsize=(10, 6), dpi=100, facecolor='#2d2d2d')
-        self.ax = self.fig.add_subplot(111, facecolor='#1a1a1a')
-        self.canvas = FigureCanvasTkAgg(self.fig, chart_card)
-        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, padx=15, pady=(0, 15))
+        self.canvas = FigureCanvasTkAgg(self.fig, chart_tab)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        
+        # ダッシュボード（パネルのグリッド、描画は RenderScheduler がまとめて行う）
+        self.dashboard = RenderScheduler(self.pipeline)
+        self.dashboard.active = False
+        for row, panels in enumerate(DASHBOARD_LAYOUT):
+            dashboard_tab.rowconfigure(row, weight=1)
+            for column, (kind, security) in enumerate(panels):
+                dashboard_tab.columnconfigure(column, weight=1)
+                panel = create_panel(kind, security)
+                panel_canvas = FigureCanvasTkAgg(panel.fig, dashboard_tab)
+                panel_canvas.get_tk_widget().grid(row=row, column=column, sticky='nsew',
+                                                  padx=2, pady=2)
+                panel.attach(panel_canvas)
+                self.dashboard.add(panel)
         
         # サイドパネル（統計情報）
         side_panel = tk.Frame(content_frame, bg='#2d2d2d', width=300, relief='flat', bd=1)
@@ -206,7 +677,8 @@ class LMECopperMonitor:
         self.news_text.pack(fill=tk.BOTH, expand=True)
         
         # 初期チャート設定
-        self.setup_initial_chart()
+        self.chart = PriceChart(self.fig, self.canvas,
+                                {overlay: var.get() for overlay, var in self.overlay_vars.items()})
         
     def create_stat_card(self, parent, title, value, color):
         """統計情報カードを作成"""
@@ -224,27 +696,53 @@ class LMECopperMonitor:
             self.stat_labels = {}
         self.stat_labels[title.lower()] = value_label
         
-    def setup_initial_chart(self):
-        # ダークテーマでチャートを設定
-        self.ax.set_title("LME Copper Price", color='white', fontsize=14, pad=20)
-        self.ax.set_xlabel("Time", color='white', fontsize=11)
-        self.ax.set_ylabel("Price (USD/ton)", color='white', fontsize=11)
+    def on_security_selected(self, event=None):
+        """表示銘柄の切り替え"""
+        self.delivery_var.set(format_policy(self.delivery.policy(self.selected_security.get())))
+        if self.pipeline.has_ticks(self.selected_security.get()):
+            self.update_chart()
         
-        # グリッドの設定
-        self.ax.grid(True, alpha=0.2, color='#444444', linestyle='-', linewidth=0.5)
+    def on_overlay_toggled(self):
+        """指標オーバーレイの表示切り替え"""
+        for overlay, var in self.overlay_vars.items():
+            self.chart.set_overlay_visible(overlay, var.get())
+        if self.pipeline.has_ticks(self.selected_security.get()):
+            self.update_chart()
+        else:
+            self.canvas.draw_idle()
         
-        # 軸の色を設定
-        self.ax.tick_params(colors='white', labelsize=9)
-        self.ax.spines['bottom'].set_color('#444444')
-        self.ax.spines['top'].set_color('#444444')
-        self.ax.spines['right'].set_color('#444444')
-        self.ax.spines['left'].set_color('#444444')
+    def on_delivery_changed(self):
+        """表示銘柄の配信ポリシーを変更（サーバー側の間隔が変わる場合は再購読）"""
+        security = self.selected_security.get()
+        if security not in self.securities:
+            messagebox.showerror("Error", f"{security} is derived; set the policy of its inputs")
+            return
+        try:
+            resubscribe = self.delivery.set_policy(security, self.delivery_var.get())
+        except DeliveryPolicyError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        policy = self.delivery.policy(security)
+        self.delivery_var.set(format_policy(policy))
+        logger.info(f"Delivery policy for {security}: {format_policy(policy)}")
         
-        # 背景色設定
-        self.ax.set_facecolor('#1a1a1a')
-        self.fig.patch.set_facecolor('#2d2d2d')
+        if resubscribe and self.running and security in self.correlation_ids:
+            try:
+                subscriptions = blpapi.SubscriptionList()
+                subscriptions.add(security, ",".join(TICK_FIELDS), subscription_options(policy),
+                                  self.correlation_ids[security])
+                self.session.resubscribe(subscriptions)
+            except Exception as e:
+                logger.error(f"Error resubscribing {security}: {e}")
         
-        self.canvas.draw()
+    def on_tab_changed(self, event=None):
+        """ダッシュボードは表示中のみ描画する"""
+        self.dashboard.active = self.chart_tabs.index('current') == 1
+        if self.dashboard.active:
+            self.dashboard.invalidate()
+            self.dashboard.render()
+        elif self.pipeline.has_ticks(self.selected_security.get()):
+            self.update_chart()
         
     def setup_bloomberg_connection(self):
         if not BLPAPI_AVAILABLE:
@@ -291,20 +789,20 @@ class LMECopperMonitor:
                 for service_name in news_services:
                     try:
                         if self.session.openService(service_name):
-                            print(f"Opened service: {service_name}")
+                            logger.info(f"Opened service: {service_name}")
                             self.news_session = self.session
                             return
                     except Exception as e:
-                        print(f"Failed to open {service_name}: {e}")
+                        logger.warning(f"Failed to open {service_name}: {e}")
                         continue
                 
-                print("No news services available, will use web scraping fallback")
+                logger.info("No news services available, will use web scraping fallback")
                 self.news_session = None
             else:
                 self.news_session = None
                 
         except Exception as e:
-            print(f"Error setting up news session: {e}")
+            logger.error(f"Error setting up news session: {e}")
             self.news_session = None
             
     def start_monitoring(self):
@@ -344,9 +842,14 @@ class LMECopperMonitor:
         
     def bloomberg_data_thread(self):
         try:
-            # LME Copper銘柄コード - 正しいBloomberg形式
+            # 監視銘柄と派生銘柄の入力銘柄を購読（CorrelationIdに銘柄名、
+            # interval ポリシーの銘柄はサーバー側で間引く）
             subscriptions = blpapi.SubscriptionList()
-            subscriptions.add("LMCADS03 Comdty", "LAST_PRICE,BID,ASK")  # LME Copper 3-month
+            for security in self.securities:
+                self.correlation_ids[security] = blpapi.CorrelationId(security)
+                subscriptions.add(security, ",".join(TICK_FIELDS),
+                                  subscription_options(self.delivery.policy(security)),
+                                  self.correlation_ids[security])
             
             self.session.subscribe(subscriptions)
             
@@ -354,38 +857,55 @@ class LMECopperMonitor:
                 event = self.session.nextEvent(timeout=1000)
                 
                 if event.eventType() == blpapi.Event.SUBSCRIPTION_DATA:
+                    # 同じイベントで届いたティックは同時刻とする（派生銘柄をまとめて計算）
+                    timestamp = time.time()
                     for msg in event:
-                        self.process_bloomberg_data(msg)
+                        self.process_bloomberg_data(msg, timestamp)
+                        
+                # 受信側で間引いている銘柄の、窓が閉じた分を送る
+                self.delivery.flush(time.time())
                         
         except Exception as e:
-            self.data_queue.put(("error", f"Bloomberg data error: {str(e)}"))
+            self.pipeline.put_data("error", f"Bloomberg data error: {str(e)}")
             
-    def process_bloomberg_data(self, msg):
+    def process_bloomberg_data(self, msg, timestamp):
         try:
-            if msg.hasElement("LAST_PRICE"):
+            # null の要素は無いものとして扱う（excludeNullElements=True）
+            if msg.hasElement("LAST_PRICE", True):
+                security = msg.correlationIds()[0].value()
                 price = msg.getElement("LAST_PRICE").getValueAsFloat()
-                timestamp = datetime.datetime.now()
                 
-                data = {"price": price, "time": timestamp}
-                self.data_queue.put(("price", data))
+                # 同じメッセージに含まれる他のフィールドも保存
+                # （読めないフィールドがあっても価格は捨てない）
+                fields = {}
+                for field in TICK_FIELDS:
+                    if field == "LAST_PRICE":
+                        continue
+                    try:
+                        if msg.hasElement(field, True):
+                            fields[field] = msg.getElement(field).getValueAsFloat()
+                    except Exception as e:
+                        logger.debug(f"Skipping {field} for {security}: {e}")
+                
+                self.delivery.on_tick(security, timestamp, price, fields)
                 
         except Exception as e:
-            print(f"Error processing Bloomberg data: {e}")
+            logger.error(f"Error processing Bloomberg data: {e}")
     
     def news_thread_manager(self):
         """ニューススレッドの管理"""
         if self.news_session:
-            print("Starting Bloomberg news thread...")
+            logger.info("Starting Bloomberg news thread...")
             self.bloomberg_news_thread()
         else:
-            print("Bloomberg news service not available")
+            logger.warning("Bloomberg news service not available")
     
     def bloomberg_news_thread(self):
         try:
             # Reference Data Service経由でニュース関連フィールドを取得
             if self.news_session.openService("//blp/refdata"):
                 service = self.news_session.getService("//blp/refdata")
-                print("Using Reference Data Service for news-related data")
+                logger.info("Using Reference Data Service for news-related data")
                 
                 # ニュース関連フィールドの取得
                 request = service.createRequest("ReferenceDataRequest")
@@ -396,17 +916,17 @@ class LMECopperMonitor:
                 for field in fields:
                     request.getElement("fields").appendValue(field)
                 
-                print("Requesting reference data with news fields...")
+                logger.debug("Requesting reference data with news fields...")
                 
                 while self.running:
                     self.fetch_reference_data(service, request)
                     time.sleep(300)  # 5分間隔で更新
                     
             else:
-                print("Failed to open Reference Data Service")
+                logger.error("Failed to open Reference Data Service")
                 
         except Exception as e:
-            print(f"Bloomberg news thread error: {str(e)}")
+            logger.error(f"Bloomberg news thread error: {str(e)}")
     
     def fetch_reference_data(self, service, request):
         """Reference Data取得処理"""
@@ -418,7 +938,7 @@ class LMECopperMonitor:
                 event = self.news_session.nextEvent(timeout=1000)
                 
                 if event.eventType() == blpapi.Event.RESPONSE:
-                    print("Received reference data response")
+                    logger.debug("Received reference data response")
                     for msg in event:
                         self.process_reference_data(msg)
                     break
@@ -429,16 +949,16 @@ class LMECopperMonitor:
                 timeout_counter += 1
                         
         except Exception as e:
-            print(f"Error fetching reference data: {str(e)}")
+            logger.error(f"Error fetching reference data: {str(e)}")
     
     def process_reference_data(self, msg):
         """Reference Dataの処理"""
         try:
-            print(f"Full message content: {msg}")
+            logger.debug(f"Full message content: {msg}")
             
             if msg.hasElement("securityData"):
                 security_data = msg.getElement("securityData")
-                print(f"Found {security_data.numValues()} securities")
+                logger.debug(f"Found {security_data.numValues()} securities")
                 
                 for i in range(security_data.numValues()):
                     security = security_data.getValueAsElement(i)
@@ -446,11 +966,11 @@ class LMECopperMonitor:
                     sec_name = "Unknown"
                     if security.hasElement("security"):
                         sec_name = security.getElement("security").getValueAsString()
-                        print(f"Processing security: {sec_name}")
+                        logger.debug(f"Processing security: {sec_name}")
                         
                     if security.hasElement("fieldData"):
                         field_data = security.getElement("fieldData")
-                        print(f"Field data available for {sec_name}")
+                        logger.debug(f"Field data available for {sec_name}")
                         
                         # すべての利用可能なフィールドをデバッグ出力
                         for j in range(field_data.numElements()):
@@ -458,9 +978,9 @@ class LMECopperMonitor:
                             field_name = element.name()
                             try:
                                 field_value = element.getValueAsString()
-                                print(f"  {field_name}: {field_value}")
+                                logger.debug(f"  {field_name}: {field_value}")
                             except:
-                                print(f"  {field_name}: [complex data]")
+                                logger.debug(f"  {field_name}: [complex data]")
                         
                         # 基本情報をニュースパネルに表示
                         timestamp = datetime.datetime.now().strftime("%H:%M:%S")
@@ -468,39 +988,37 @@ class LMECopperMonitor:
                         if field_data.hasElement("NAME"):
                             name = field_data.getElement("NAME").getValueAsString()
                             news_text = f"[{timestamp}] {sec_name}: {name}"
-                            self.news_queue.put(news_text)
-                            print(f"Added news: {news_text}")
+                            self.pipeline.put_news(news_text)
+                            logger.debug(f"Added news: {news_text}")
                             
                         if field_data.hasElement("LAST_UPDATE_DT"):
                             last_update = field_data.getElement("LAST_UPDATE_DT").getValueAsString()
                             news_text = f"[{timestamp}] Last Update: {last_update}"
-                            self.news_queue.put(news_text)
-                            print(f"Added news: {news_text}")
+                            self.pipeline.put_news(news_text)
+                            logger.debug(f"Added news: {news_text}")
                             
                         # セキュリティ説明があれば表示
                         if field_data.hasElement("SECURITY_DES"):
                             desc = field_data.getElement("SECURITY_DES").getValueAsString()
                             news_text = f"[{timestamp}] Description: {desc}"
-                            self.news_queue.put(news_text)
-                            print(f"Added news: {news_text}")
+                            self.pipeline.put_news(news_text)
+                            logger.debug(f"Added news: {news_text}")
                             
                     if security.hasElement("fieldExceptions"):
                         exceptions = security.getElement("fieldExceptions")
-                        print(f"Field exceptions for {sec_name}:")
+                        logger.debug(f"Field exceptions for {sec_name}:")
                         for j in range(exceptions.numValues()):
                             exception = exceptions.getValueAsElement(j)
                             if exception.hasElement("fieldId"):
                                 field_id = exception.getElement("fieldId").getValueAsString()
-                                print(f"  Exception for field: {field_id}")
+                                logger.debug(f"  Exception for field: {field_id}")
                         
         except Exception as e:
-            print(f"Error processing reference data: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Error processing reference data: {e}")
             
     def process_news_data(self, msg):
         try:
-            print(f"Processing news message type: {msg.messageType()}")
+            logger.debug(f"Processing news message type: {msg.messageType()}")
             
             # Bloomberg News APIの様々なレスポンス形式に対応
             if msg.hasElement("newsItems") or msg.hasElement("GetNewsResponse"):
@@ -515,7 +1033,7 @@ class LMECopperMonitor:
                     news_items = msg.getElement("newsItems")
                 
                 if news_items and news_items.numValues() > 0:
-                    print(f"Found {news_items.numValues()} news items")
+                    logger.debug(f"Found {news_items.numValues()} news items")
                     
                     for i in range(news_items.numValues()):
                         item = news_items.getValueAsElement(i)
@@ -556,30 +1074,36 @@ class LMECopperMonitor:
                                 time_str = datetime.datetime.now().strftime("%H:%M")
                             
                             news_text = f"[{time_str}] {source}: {headline}"
-                            self.news_queue.put(news_text)
-                            print(f"Added news: {news_text}")
+                            self.pipeline.put_news(news_text)
+                            logger.debug(f"Added news: {news_text}")
                 else:
-                    print("No news items found in response")
+                    logger.debug("No news items found in response")
             else:
-                print("No recognized news elements in message")
+                logger.debug("No recognized news elements in message")
                         
         except Exception as e:
-            print(f"Error processing news data: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Error processing news data: {e}")
             
     def demo_data_thread(self):
-        base_price = 8500  # USD/ton
+        base_prices = {security: DEMO_BASE_PRICES.get(security, 100.0)
+                       for security in self.securities}
         
         while self.running:
-            # ランダムな価格変動を生成
-            change = np.random.normal(0, 20)  # 平均0、標準偏差20の変動
-            price = base_price + change
-            base_price = price
-            
             timestamp = datetime.datetime.now()
             
-            self.data_queue.put(("price", {"price": price, "time": timestamp}))
+            for security, base_price in base_prices.items():
+                # ランダムな価格変動を生成（価格水準に比例、8500ドルで標準偏差20）
+                change = np.random.normal(0, base_price * 20 / 8500)
+                price = base_price + change
+                base_prices[security] = price
+                
+                spread = base_price * 0.0002
+                fields = {"BID": price - spread / 2,
+                          "ASK": price + spread / 2,
+                          "SIZE_LAST_TRADE": float(np.random.randint(1, 50))}
+                
+                self.delivery.on_tick(security, timestamp.timestamp(), price, fields)
+            self.delivery.flush(time.time())
             
             # デモニュース
             if np.random.random() < 0.1:  # 10%の確率でニュース
@@ -591,182 +1115,119 @@ class LMECopperMonitor:
                     "Copper demand expected to surge with green energy transition"
                 ]
                 news = np.random.choice(news_items)
-                self.news_queue.put(f"{timestamp.strftime('%H:%M:%S')} - {news}")
+                self.pipeline.put_news(f"{timestamp.strftime('%H:%M:%S')} - {news}")
             
             time.sleep(2)  # 2秒間隔
             
     def update_ui_thread(self):
         try:
             # データキューから価格データを取得
-            while not self.data_queue.empty():
-                data_type, data = self.data_queue.get_nowait()
+            for error in self.pipeline.process_data_queue():
+                messagebox.showerror("Error", error)
+                
+            # キューが溢れて捨てたティックはティック履歴にも保存されない
+            dropped = self.pipeline.dropped_ticks
+            if dropped > self.reported_drops:
+                logger.warning(f"Queue full: dropped {dropped - self.reported_drops} ticks "
+                               f"({dropped} total); these ticks are not recorded")
+                self.reported_drops = dropped
                 
-                if data_type == "price":
-                    self.price_data.append(data["price"])
-                    self.timestamps.append(data["time"])
-                    
-                    # 最新100件のデータのみ保持
-                    if len(self.price_data) > 100:
-                        self.price_data.pop(0)
-                        self.timestamps.pop(0)
-                        
-                elif data_type == "error":
-                    messagebox.showerror("Error", data)
-                    
             # ニュースキューからニュースを取得
-            while not self.news_queue.empty():
-                news = self.news_queue.get_nowait()
+            news_queue = self.pipeline.news_queue
+            while not news_queue.empty():
+                news = news_queue.get_nowait()
                 self.news_text.insert(tk.END, news + "\n")
                 self.news_text.see(tk.END)
                 
+            # 古いニュースを削除（長時間稼働でのメモリ増加を防ぐ）
+            line_count = int(self.news_text.index('end-1c').split('.')[0])
+            if line_count > MAX_NEWS_LINES:
+                self.news_text.delete('1.0', f'{line_count - MAX_NEWS_LINES + 1}.0')
+                
             # チャート更新
-            if self.price_data and self.running:
+            if self.pipeline.has_ticks(self.selected_security.get()) and self.running:
                 self.update_chart()
+            # ダッシュボードはデータが変わったパネルだけ描画
+            if self.running:
+                self.dashboard.render()
+                
+            # 未保存のティックをディスクに追記
+            self.pipeline.tick_store.flush()
                 
         except queue.Empty:
             pass
         except Exception as e:
-            print(f"UI update error: {e}")
+            logger.error(f"UI update error: {e}")
             
         # 継続的な更新
         if self.running:
             self.root.after(1000, self.update_ui_thread)  # 1秒間隔
             
     def update_chart(self):
-        self.ax.clear()
-        
-        # チャートスタイルを再設定
-        self.ax.set_facecolor('#1a1a1a')
-        self.ax.tick_params(colors='white', labelsize=9)
-        self.ax.spines['bottom'].set_color('#444444')
-        self.ax.spines['top'].set_color('#444444')
-        self.ax.spines['right'].set_color('#444444')
-        self.ax.spines['left'].set_color('#444444')
-        
-        if len(self.price_data) > 1:
-            # Y軸の自動スケーリング（価格変動を見やすくする）
-            min_price = min(self.price_data)
-            max_price = max(self.price_data)
-            price_range = max_price - min_price
-            
-            # 価格変動が小さい場合のマージン調整
-            if price_range < 10:  # 変動が10ドル未満の場合
-                margin = max(5, price_range * 0.1)  # 最小5ドルまたは変動の10%
-            else:
-                margin = price_range * 0.05  # 変動の5%
-            
-            # Y軸の範囲を設定
-            self.ax.set_ylim(min_price - margin, max_price + margin)
-            
-            # グラデーション効果のある線
-            self.ax.plot(self.timestamps, self.price_data, 
-                        color='#00ff88', linewidth=2.5, alpha=0.9)
-            
-            # エリアチャート（塗りつぶし）
-            self.ax.fill_between(self.timestamps, self.price_data, 
-                               alpha=0.2, color='#00ff88')
-            
-            # 最新価格をハイライト
-            if self.price_data:
-                latest_price = self.price_data[-1]
-                latest_time = self.timestamps[-1]
-                
-                # 大きな点
-                self.ax.plot(latest_time, latest_price, 'o', 
-                           color='#ffff00', markersize=12, alpha=0.8)
-                self.ax.plot(latest_time, latest_price, 'o', 
-                           color='#ff4444', markersize=8)
-                
-                # 価格ラベル（モダンスタイル）
-                self.ax.annotate(f'${latest_price:.2f}', 
-                               xy=(latest_time, latest_price),
-                               xytext=(15, 15), textcoords='offset points',
-                               bbox=dict(boxstyle='round,pad=0.5', 
-                                       facecolor='#4CAF50', 
-                                       edgecolor='none',
-                                       alpha=0.9),
-                               color='white',
-                               fontweight='bold',
-                               fontsize=11)
-                
-                # 現在価格をヘッダーに更新
-                self.price_label.config(text=f"${latest_price:.2f}")
-                
-                # 統計情報を更新
-                if len(self.price_data) > 1:
-                    high_price = max(self.price_data)
-                    low_price = min(self.price_data)
-                    change_pct = ((latest_price - self.price_data[0]) / self.price_data[0]) * 100
-                    
-                    self.stat_labels['high'].config(text=f"${high_price:.2f}")
-                    self.stat_labels['low'].config(text=f"${low_price:.2f}")
-                    self.stat_labels['change'].config(
-                        text=f"{change_pct:+.2f}%",
-                        fg='#4CAF50' if change_pct >= 0 else '#f44336'
-                    )
-                    self.stat_labels['volume'].config(text=str(len(self.price_data)))
-                    
-                    # Y軸範囲をタイトルに表示（デバッグ用）
-                    range_info = f"Range: ${min_price:.2f} - ${max_price:.2f}"
-                    print(f"Chart range: {range_info}, Margin: {margin:.2f}")
-        
-        # タイトルとラベル（ダークテーマ）
-        self.ax.set_title("Real-Time Price Movement", 
-                         color='white', fontsize=12, pad=15)
-        self.ax.set_xlabel("Time", color='white', fontsize=10)
-        self.ax.set_ylabel("Price (USD/ton)", color='white', fontsize=10)
-        
-        # グリッド
-        self.ax.grid(True, alpha=0.2, color='#444444', linestyle='-', linewidth=0.5)
+        security = self.selected_security.get()
+        ticks, values = self.pipeline.chart_data(security, CHART_POINTS)
+        price_data = ticks["LAST_PRICE"]
+        if len(price_data) < 2:
+            return
+        # ダッシュボード表示中は隠れている単一チャートを描画しない
+        if not self.dashboard.active:
+            self.chart.update(security, ticks["time"], price_data, values)
         
-        # Y軸の数値フォーマット（価格に適した表示）
-        if len(self.price_data) > 1:
-            price_range = max(self.price_data) - min(self.price_data)
-            
-            # 価格変動に応じて小数点桁数を調整
-            if price_range < 1:
-                # 変動が1ドル未満の場合、小数点以下3桁まで表示
-                self.ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'${x:.3f}'))
-            elif price_range < 10:
-                # 変動が10ドル未満の場合、小数点以下2桁まで表示
-                self.ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'${x:.2f}'))
-            else:
-                # それ以上の場合は整数表示
-                self.ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'${x:.0f}'))
+        # 現在価格をヘッダーに更新
+        latest_price = float(price_data[-1])
+        self.price_label.config(text=f"${latest_price:.2f}")
         
-        # X軸の時間フォーマット
-        if self.timestamps:
-            self.ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
-            self.ax.xaxis.set_major_locator(mdates.SecondLocator(interval=30))
-            
-        plt.setp(self.ax.xaxis.get_majorticklabels(), rotation=45, color='white')
-        plt.setp(self.ax.yaxis.get_majorticklabels(), color='white')
+        # 統計情報を更新
+        high_price = float(price_data.max())
+        low_price = float(price_data.min())
+        # スプレッドは負やゼロになり得るため絶対値で割る
+        first_price = float(price_data[0])
+        change_pct = ((latest_price - first_price) / abs(first_price)) * 100 if first_price else 0.0
         
-        self.fig.tight_layout()
-        self.canvas.draw()
+        self.stat_labels['high'].config(text=f"${high_price:.2f}")
+        self.stat_labels['low'].config(text=f"${low_price:.2f}")
+        self.stat_labels['change'].config(
+            text=f"{change_pct:+.2f}%",
+            fg='#4CAF50' if change_pct >= 0 else '#f44336'
+        )
+        self.stat_labels['volume'].config(text=str(len(price_data)))
         
     def stop_monitoring(self):
         self.running = False
         self.start_button.config(state=tk.NORMAL)
         self.stop_button.config(state=tk.DISABLED)
         
+        # 間引き中の保留分も処理してから保存
+        self.delivery.flush()
+        self.pipeline.process_data_queue()
+        received = sum(self.delivery.received.values())
+        delivered = sum(self.delivery.delivered.values())
+        logger.info(f"Feed ticks: {received} received, {delivered} delivered")
+        
+        try:
+            self.pipeline.tick_store.flush()
+        except (OSError, TickStoreError) as e:
+            logger.error(f"Error saving ticks: {e}")
+            
         if self.session:
             try:
                 self.session.stop()
             except Exception as e:
-                print(f"Error stopping session: {e}")
+                logger.error(f"Error stopping session: {e}")
                 
         if self.news_session:
             try:
                 self.news_session.stop()
             except Exception as e:
-                print(f"Error stopping news session: {e}")
+                logger.error(f"Error stopping news session: {e}")
             
     def on_closing(self):
         self.stop_monitoring()
         self.root.destroy()
 
 def main():
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     root = tk.Tk()
     app = LMECopperMonitor(root)
     
@@ -0,0 +1,415 @@
+"""ソークテスト（長時間稼働でのメモリ・描画レイテンシのドリフト計測）
+
+実際の処理（MarketDataPipeline のキュー → TickStore / 派生銘柄 / 指標 →
+PriceChart の描画）に、合成した高頻度フィードまたは保存済みティックの
+リプレイを流し、時間を加速して数時間分を実行する。描画は Agg（画面不要）。
+
+1フレーム = 1秒（シミュレーション時間）で、フレームは待たずに連続実行する。
+一定間隔で RSS・オブジェクト数・GC停止時間・描画レイテンシを記録し、
+ウォームアップ後の最初と最後を比べたドリフトが上限を超えた場合は
+終了コード1で終わる。--tracemalloc 指定時はウォームアップ後に増えた
+確保元の上位も出力する（描画が遅くなるためレイテンシの判定は行わない）。
+
+    python soak.py --hours 4 --rate 200
+    python soak.py --replay ticks --hours 8 --report soak.json
+    python soak.py --hours 1 --tracemalloc
+"""
+import argparse
+import collections
+import datetime
+import gc
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import numpy as np
+
+import main
+from dashboard import DASHBOARD_LAYOUT, RenderScheduler, create_panel
+from delivery import TickConflator, parse_policy
+from tickstore import TickArchive
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+
+def rss_mb():
+    """現在の常駐メモリ（MB）"""
+    if PSUTIL_AVAILABLE:
+        return psutil.Process().memory_info().rss / 2**20
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        import resource
+        # ピーク値しか取れない環境（macOSはバイト、Linuxはキロバイト）
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+class SyntheticFeed:
+    """ランダムウォークの合成ティック（全銘柄合計で rate 件/秒）"""
+
+    def __init__(self, securities, rate, seed=None):
+        self.securities = list(securities)
+        self.rate = rate
+        self.rng = np.random.default_rng(seed)
+        self.prices = np.array([main.DEMO_BASE_PRICES.get(security, 100.0)
+                                for security in self.securities])
+
+    def ticks(self, start, end):
+        count = self.rng.poisson(self.rate * (end - start))
+        times = np.sort(self.rng.uniform(start, end, count))
+        indexes = self.rng.integers(0, len(self.securities), count)
+        # 8500ドルで標準偏差2（デモモードの1/10、ティック数が多いため）
+        steps = self.rng.normal(0, 2 / 8500, count)
+        sizes = self.rng.integers(1, 50, count)
+        for epoch, index, step, size in zip(times, indexes, steps, sizes):
+            price = self.prices[index] * (1 + step)
+            self.prices[index] = price
+            spread = price * 0.0002
+            yield self.securities[index], epoch, float(price), {
+                "BID": price - spread / 2,
+                "ASK": price + spread / 2,
+                "SIZE_LAST_TRADE": float(size),
+            }
+
+
+class ReplayFeed:
+    """保存済みティックを時刻順にリプレイ（最後まで行ったら繰り返す）"""
+
+    def __init__(self, directory, securities, origin):
+        archive = TickArchive(directory)
+        names, times, prices, sizes = [], [], [], []
+        for index, security in enumerate(securities):
+            ticks = archive.query(security, fields=["LAST_PRICE", "SIZE_LAST_TRADE"])
+            if not len(ticks["time"]):
+                continue
+            names.append(security)
+            times.append(ticks["time"])
+            prices.append(ticks["LAST_PRICE"])
+            sizes.append(ticks["SIZE_LAST_TRADE"])
+        if not names:
+            raise SystemExit(f"No ticks to replay in {directory}")
+        security_index = np.concatenate([np.full(len(t), i) for i, t in enumerate(times)])
+        times = np.concatenate(times)
+        order = np.argsort(times, kind="stable")
+        self.names = names
+        self.security_index = security_index[order]
+        self.times = times[order] - times[order][0]
+        self.prices = np.concatenate(prices)[order]
+        self.sizes = np.concatenate(sizes)[order]
+        self.span = self.times[-1] + 1.0
+        self.origin = origin
+        self.cursor = 0
+        self.cycle = 0
+
+    def ticks(self, start, end):
+        while True:
+            epoch = self.origin + self.cycle * self.span + self.times[self.cursor]
+            if epoch >= end:
+                return
+            fields = {}
+            if self.sizes[self.cursor] == self.sizes[self.cursor]:  # NaNでない
+                fields["SIZE_LAST_TRADE"] = float(self.sizes[self.cursor])
+            yield (self.names[self.security_index[self.cursor]], epoch,
+                   float(self.prices[self.cursor]), fields)
+            self.cursor += 1
+            if self.cursor == len(self.times):
+                self.cursor = 0
+                self.cycle += 1
+
+
+class GCPauseRecorder:
+    """gc.callbacks でGCの停止時間を計測"""
+
+    def __init__(self):
+        self.pauses = []
+        self._start = None
+
+    def __call__(self, phase, info):
+        if phase == "start":
+            self._start = time.perf_counter()
+        elif self._start is not None:
+            self.pauses.append((time.perf_counter() - self._start) * 1000)
+            self._start = None
+
+    def take(self):
+        pauses, self.pauses = self.pauses, []
+        return pauses
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if len(values) else 0.0
+
+
+def _top_types(limit=10):
+    counts = collections.Counter(type(obj).__name__ for obj in gc.get_objects())
+    return counts.most_common(limit)
+
+
+class SoakTest:
+    def __init__(self, args):
+        self.args = args
+        self.tick_directory = args.tick_directory or tempfile.mkdtemp(prefix="soak_ticks_")
+        self.pipeline = main.MarketDataPipeline(self.tick_directory,
+                                                max_memory_rows=args.max_memory_rows)
+        self.security = args.security or self.pipeline.securities[0]
+        # 全銘柄に --delivery のポリシーを適用（サーバー側が無いため interval は受信側で間引く）
+        self.delivery = TickConflator(self.pipeline.put_tick, default=args.delivery,
+                                      server_side=False)
+
+        fig = Figure(figsize=(10, 6), dpi=100, facecolor='#2d2d2d')
+        self.chart = main.PriceChart(fig, FigureCanvasAgg(fig),
+                                     {overlay: overlay != "RSI" for overlay in main.CHART_OVERLAYS})
+        # --dashboard 指定時は単一チャートの代わりにダッシュボード全体を描画
+        self.dashboard = None
+        if args.dashboard:
+            self.dashboard = RenderScheduler(self.pipeline)
+            for panels in DASHBOARD_LAYOUT:
+                for kind, security in panels:
+                    panel = create_panel(kind, security)
+                    panel.attach(FigureCanvasAgg(panel.fig))
+                    self.dashboard.add(panel)
+
+        self.origin = time.time()
+        if args.replay:
+            self.feed = ReplayFeed(args.replay, self.pipeline.securities, self.origin)
+        else:
+            self.feed = SyntheticFeed(self.pipeline.securities, args.rate, args.seed)
+
+        self.gc_pauses = GCPauseRecorder()
+        self.samples = []
+        self.baseline_snapshot = None
+        self.final_snapshot = None
+
+    def run(self):
+        args = self.args
+        frames = int(args.hours * 3600)
+        warmup_frames = int(frames * args.warmup)
+        if args.tracemalloc:
+            tracemalloc.start(args.tracemalloc_frames)
+        gc.callbacks.append(self.gc_pauses)
+
+        render_ms, process_ms = [], []
+        ticks = 0
+        wall_start = time.perf_counter()
+        try:
+            for frame in range(1, frames + 1):
+                frame_start = self.origin + frame - 1
+                frame_end = frame_start + 1
+
+                # フィードスレッドと同じくキュー経由で投入
+                started = time.perf_counter()
+                for security, epoch, price, fields in self.feed.ticks(frame_start, frame_end):
+                    self.delivery.on_tick(security, epoch, price, fields)
+                    ticks += 1
+                self.delivery.flush(frame_end)
+                self.pipeline.process_data_queue()
+                self.pipeline.tick_store.flush()
+                process_ms.append((time.perf_counter() - started) * 1000)
+
+                if frame % args.render_every == 0:
+                    started = time.perf_counter()
+                    if self.dashboard:
+                        self.dashboard.render()
+                    else:
+                        chart_ticks, values = self.pipeline.chart_data(self.security,
+                                                                       main.CHART_POINTS)
+                        if len(chart_ticks["LAST_PRICE"]) >= 2:
+                            self.chart.update(self.security, chart_ticks["time"],
+                                              chart_ticks["LAST_PRICE"], values)
+                    render_ms.append((time.perf_counter() - started) * 1000)
+
+                if frame == warmup_frames and args.tracemalloc:
+                    self.baseline_snapshot = tracemalloc.take_snapshot()
+                if frame % args.sample_interval == 0 or frame == frames:
+                    self.samples.append(self.sample(frame, time.perf_counter() - wall_start,
+                                                    ticks, render_ms, process_ms))
+                    render_ms, process_ms = [], []
+                    self.report_progress(frames)
+
+                # --speedup 指定時は実時間に対する倍率を上限にする
+                if args.speedup:
+                    ahead = frame / args.speedup - (time.perf_counter() - wall_start)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        finally:
+            gc.callbacks.remove(self.gc_pauses)
+            if args.tracemalloc:
+                self.final_snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+        return self.evaluate(warmup_frames)
+
+    def sample(self, frame, wall, ticks, render_ms, process_ms):
+        pauses = self.gc_pauses.take()
+        sample = {
+            "sim_hours": frame / 3600,
+            "wall_seconds": wall,
+            "ticks": ticks,
+            "delivered": sum(self.delivery.delivered.values()),
+            "dropped_ticks": self.pipeline.dropped_ticks,
+            "dropped_news": self.pipeline.dropped_news,
+            "rss_mb": rss_mb(),
+            "objects": len(gc.get_objects()),
+            "gc_collections": len(pauses),
+            "gc_pause_max_ms": max(pauses, default=0.0),
+            "gc_pause_total_ms": float(sum(pauses)),
+            "render_p50_ms": _percentile(render_ms, 50),
+            "render_p95_ms": _percentile(render_ms, 95),
+            "render_max_ms": max(render_ms, default=0.0),
+            "process_p95_ms": _percentile(process_ms, 95),
+        }
+        if self.args.tracemalloc:
+            sample["traced_mb"] = tracemalloc.get_traced_memory()[0] / 2**20
+        return sample
+
+    def report_progress(self, frames):
+        sample = self.samples[-1]
+        main.logger.info(
+            f"[{sample['sim_hours']:.2f}/{frames / 3600:.2f}h] "
+            f"rss={sample['rss_mb']:.1f}MB objects={sample['objects']} "
+            f"render p95={sample['render_p95_ms']:.1f}ms "
+            f"gc max={sample['gc_pause_max_ms']:.1f}ms ticks={sample['ticks']}")
+
+    def evaluate(self, warmup_frames):
+        """ウォームアップ後の最初と最後のサンプルを比べてドリフトを判定"""
+        args = self.args
+        measured = [s for s in self.samples if s["sim_hours"] * 3600 > warmup_frames]
+        if len(measured) < 2:
+            measured = self.samples
+        window = max(1, min(3, len(measured) // 4))
+        first, last = measured[:window], measured[-window:]
+
+        def median(samples, key):
+            return float(np.median([s[key] for s in samples]))
+
+        rss_growth = median(last, "rss_mb") - median(first, "rss_mb")
+        baseline_latency = median(first, "render_p95_ms")
+        latency_growth = (median(last, "render_p95_ms") / baseline_latency
+                          if baseline_latency > 0 else 1.0)
+        hours = [s["sim_hours"] for s in measured]
+        rss_slope = (float(np.polyfit(hours, [s["rss_mb"] for s in measured], 1)[0])
+                     if len(measured) > 1 and hours[-1] > hours[0] else 0.0)
+
+        failures = []
+        if rss_growth > args.max_rss_growth_mb:
+            failures.append(f"RSS grew {rss_growth:.1f}MB (limit {args.max_rss_growth_mb}MB)")
+        if latency_growth > args.max_latency_growth and not args.tracemalloc:
+            failures.append(f"render p95 latency grew x{latency_growth:.2f} "
+                            f"(limit x{args.max_latency_growth})")
+
+        report = {
+            "passed": not failures,
+            "failures": failures,
+            "config": {key: value for key, value in vars(args).items()},
+            "drift": {
+                "rss_growth_mb": rss_growth,
+                "rss_slope_mb_per_hour": rss_slope,
+                "render_p95_growth": latency_growth,
+                "objects_growth": median(last, "objects") - median(first, "objects"),
+                "gc_pause_max_ms": max(s["gc_pause_max_ms"] for s in measured),
+            },
+            "top_object_types": _top_types(),
+            "samples": self.samples,
+        }
+        if self.baseline_snapshot and self.final_snapshot:
+            stats = self.final_snapshot.compare_to(self.baseline_snapshot, "lineno")
+            report["top_allocation_growth"] = [
+                {"location": str(stat.traceback), "size_diff_kb": stat.size_diff / 1024,
+                 "count_diff": stat.count_diff}
+                for stat in stats[:args.top_allocators]]
+        return report
+
+
+def print_report(report):
+    drift = report["drift"]
+    last = report["samples"][-1]
+    print("=" * 60)
+    print(f"Soak test {'PASSED' if report['passed'] else 'FAILED'}: "
+          f"{last['sim_hours']:.2f} simulated hours in {last['wall_seconds']:.0f}s, "
+          f"{last['ticks']} ticks ({last['delivered']} delivered, "
+          f"{last['dropped_ticks']} dropped)")
+    print(f"  RSS growth:        {drift['rss_growth_mb']:+.1f} MB "
+          f"({drift['rss_slope_mb_per_hour']:+.2f} MB/h)")
+    print(f"  Render p95 growth: x{drift['render_p95_growth']:.2f} "
+          f"(last p95 {last['render_p95_ms']:.1f}ms)")
+    print(f"  Objects growth:    {drift['objects_growth']:+.0f}")
+    print(f"  Max GC pause:      {drift['gc_pause_max_ms']:.1f} ms")
+    if "top_allocation_growth" in report:
+        print("  Top allocation growth since warmup:")
+        for stat in report["top_allocation_growth"]:
+            print(f"    {stat['size_diff_kb']:+10.1f} KB {stat['count_diff']:+8d}  {stat['location']}")
+    print("  Top object types:  " + ", ".join(f"{name}={count}"
+                                              for name, count in report["top_object_types"][:5]))
+    for failure in report["failures"]:
+        print(f"  FAIL: {failure}")
+    if not report["passed"] and "top_allocation_growth" not in report:
+        print("  Re-run with --tracemalloc to find the growing allocators")
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Soak test the monitor pipeline at accelerated time")
+    parser.add_argument("--hours", type=float, default=4.0, help="simulated hours (default: %(default)s)")
+    parser.add_argument("--rate", type=float, default=200.0,
+                        help="synthetic ticks per simulated second (default: %(default)s)")
+    parser.add_argument("--replay", metavar="DIR", help="replay captured ticks from DIR instead")
+    parser.add_argument("--seed", type=int, help="random seed for the synthetic feed")
+    parser.add_argument("--security", help="charted security (default: first monitored)")
+    parser.add_argument("--speedup", type=float, default=0.0,
+                        help="max simulated/wall time ratio (default: unlimited)")
+    parser.add_argument("--delivery", default="raw", type=parse_policy,
+                        help="delivery policy for every security: raw, interval:N, last:N "
+                             "or ohlc:N (default: %(default)s)")
+    parser.add_argument("--dashboard", action="store_true",
+                        help="render the multi-panel dashboard instead of the single chart")
+    parser.add_argument("--render-every", type=int, default=1, help="render every N frames")
+    parser.add_argument("--sample-interval", type=int, default=300,
+                        help="simulated seconds between samples (default: %(default)s)")
+    parser.add_argument("--warmup", type=float, default=0.2,
+                        help="fraction of the run excluded from drift (default: %(default)s)")
+    parser.add_argument("--max-memory-rows", type=int, default=20_000,
+                        help="ticks kept in memory per security (default: %(default)s)")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=50.0)
+    parser.add_argument("--max-latency-growth", type=float, default=1.5,
+                        help="max ratio of final to initial render p95 (default: %(default)s)")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="trace allocations and report the top growing allocators "
+                             "(slows rendering, so latency limits are not checked)")
+    parser.add_argument("--tracemalloc-frames", type=int, default=1)
+    parser.add_argument("--top-allocators", type=int, default=10)
+    parser.add_argument("--tick-directory", help="where ticks are written (default: temp dir)")
+    parser.add_argument("--report", metavar="FILE", help="write the JSON report to FILE")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    started = datetime.datetime.now()
+    soak = SoakTest(args)
+    try:
+        report = soak.run()
+    finally:
+        if not args.tick_directory:
+            shutil.rmtree(soak.tick_directory, ignore_errors=True)
+    report["started"] = started.isoformat(timespec="seconds")
+    print_report(report)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["passed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,574 @@
+"""ティックデータの列指向ストアとエクスポート
+
+監視中のティックを銘柄ごとの構造化NumPy配列（時刻昇順）に蓄積し、
+日付ごとのバイナリファイル（ticks/YYYYMMDD/<銘柄>.ticks）にも追記する。
+時刻範囲の検索は np.searchsorted による二分探索で、結果は配列のビュー
+（ディスク上の履歴は np.memmap のビュー）としてコピーせずに返す。
+
+コマンドライン::
+
+    python tickstore.py list
+    python tickstore.py export "LMCADS03 Comdty" --start 2024-05-01T08:00 \\
+        --end 2024-05-01T17:00 --format parquet -o lme_3m.parquet
+"""
+import argparse
+import csv
+import datetime
+import json
+import logging
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 追記中の書き込みエラーをログに出す最小間隔（秒）
+ERROR_LOG_INTERVAL = 60.0
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# 保存するフィールド（時刻列 "time" はUNIXエポック秒）
+TICK_FIELDS = ("LAST_PRICE", "BID", "ASK", "SIZE_LAST_TRADE")
+
+# デフォルトの保存先
+TICK_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ticks")
+
+# エクスポート時に一度に読み書きする行数
+EXPORT_CHUNK_ROWS = 250_000
+
+EXPORT_FORMATS = ("csv", "parquet", "arrow")
+
+
+class TickStoreError(Exception):
+    """ティックストアのエラー"""
+
+
+def tick_dtype(fields=TICK_FIELDS):
+    return np.dtype([("time", "<f8")] + [(field, "<f8") for field in fields])
+
+
+def to_epoch(value):
+    """datetime / ISO文字列 / 数値 をエポック秒に変換（None はそのまま）"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    return float(value)
+
+
+def _file_stem(security):
+    """銘柄名をファイル名に使える形に変換"""
+    return re.sub(r"[^A-Za-z0-9.\-]+", "_", security).strip("_")
+
+
+def _day_of(epoch):
+    return datetime.datetime.fromtimestamp(epoch).date()
+
+
+def next_midnight(epoch):
+    """epoch の翌日0時（ローカル時刻）のエポック秒"""
+    day = _day_of(epoch) + datetime.timedelta(days=1)
+    return datetime.datetime.combine(day, datetime.time()).timestamp()
+
+
+def _slice_columns(records, fields):
+    """構造化配列から列ビューの辞書を作る（コピーなし）"""
+    columns = {"time": records["time"]}
+    for field in fields:
+        columns[field] = records[field]
+    return columns
+
+
+class TickBuffer:
+    """1銘柄分のティックを保持する伸長可能な構造化配列
+
+    拡張・切り詰めの際は常に新しい配列を確保するため、
+    以前に返したビューの内容が書き換わることはない。
+    """
+
+    def __init__(self, dtype, capacity=1024, max_rows=None):
+        self.dtype = dtype
+        self.max_rows = max_rows
+        if max_rows is not None:
+            capacity = min(capacity, max_rows)
+        self._data = np.empty(capacity, dtype=dtype)
+        self._size = 0
+        # 先頭から切り捨てた行数（ディスク書き込み位置の管理用）
+        self.dropped = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, epoch, values):
+        # 時刻の昇順を保証（逆行したティックは直前の時刻に揃える）
+        if self._size and epoch < self._data["time"][self._size - 1]:
+            epoch = self._data["time"][self._size - 1]
+        self.append_row((epoch,) + tuple(values.get(field, np.nan)
+                                         for field in self.dtype.names[1:]))
+
+    def append_row(self, row):
+        """時刻を含む1行（タプル）をそのまま追加"""
+        if self._size == len(self._data):
+            self._reserve()
+        self._data[self._size] = row
+        self._size += 1
+
+    def extend(self, records):
+        """時刻昇順の構造化配列をまとめて追加"""
+        if self.max_rows is not None and len(records) > self.max_rows:
+            self.dropped += self._size + len(records) - self.max_rows
+            self._size = 0
+            records = records[-self.max_rows:]
+        needed = self._size + len(records)
+        if needed > len(self._data):
+            # 上限を超える分は古い行から捨てる
+            drop = 0
+            if self.max_rows is not None:
+                drop = max(needed - self.max_rows, 0)
+            keep = self._size - drop
+            capacity = max(needed * 2, 1024)
+            if self.max_rows is not None:
+                capacity = min(capacity, self.max_rows)
+            data = np.empty(capacity, dtype=self.dtype)
+            data[:keep] = self._data[drop:self._size]
+            self.dropped += drop
+            self._data = data
+            self._size = keep
+        self._data[self._size:self._size + len(records)] = records
+        self._size += len(records)
+
+    def full(self):
+        """次の追加で古い行が切り捨てられるか"""
+        return (self.max_rows is not None and self._size == len(self._data)
+                and self._size >= self.max_rows)
+
+    def _reserve(self):
+        size = self._size
+        keep = size
+        if self.max_rows is not None and size >= self.max_rows:
+            # 上限に達したら古い半分を捨てる
+            keep = self.max_rows // 2
+        capacity = max(keep * 2, 1024)
+        if self.max_rows is not None:
+            capacity = min(capacity, self.max_rows)
+        data = np.empty(capacity, dtype=self.dtype)
+        data[:keep] = self._data[size - keep:size]
+        self.dropped += size - keep
+        self._data = data
+        self._size = keep
+
+    def records(self):
+        """有効な行のビュー"""
+        return self._data[:self._size]
+
+
+class TickStore:
+    """監視中のティックを保持し、指定ディレクトリに日付ごとに追記するストア"""
+
+    def __init__(self, directory=None, fields=TICK_FIELDS, max_memory_rows=200_000):
+        self.directory = directory
+        self.fields = tuple(fields)
+        self.dtype = tick_dtype(self.fields)
+        self.max_memory_rows = max_memory_rows
+        self._buffers = {}
+        # 銘柄 -> ディスクに書き込み済みの通算行数
+        self._written = {}
+        # スキーマ確認済みのファイル
+        self._checked_files = set()
+        # 追記中の書き込みエラー（ログの間引き用）
+        self._last_error_log = None
+        self._suppressed_errors = 0
+
+    def securities(self):
+        return list(self._buffers)
+
+    def append(self, security, timestamp, values):
+        """ティックを1件追加（timestamp は datetime またはエポック秒）"""
+        buffer = self._buffers.get(security)
+        if buffer is None:
+            buffer = TickBuffer(self.dtype, max_rows=self.max_memory_rows)
+            self._buffers[security] = buffer
+            self._written[security] = 0
+        elif self.directory and buffer.full():
+            # 切り捨て前に未保存分を書き出す。失敗してもティックの受信は止めず、
+            # 書き出せなかった行は捨てる（次回の flush で欠損としてログに出る）
+            try:
+                self._flush_security(security)
+            except (OSError, TickStoreError) as e:
+                self._log_write_error(security, e)
+        buffer.append(to_epoch(timestamp), values)
+
+    def _log_write_error(self, security, error):
+        now = time.monotonic()
+        if self._last_error_log is not None and now - self._last_error_log < ERROR_LOG_INTERVAL:
+            self._suppressed_errors += 1
+            return
+        suppressed = f" ({self._suppressed_errors} similar errors suppressed)" \
+            if self._suppressed_errors else ""
+        logger.error(f"Error saving ticks for {security}: {error}{suppressed}")
+        self._last_error_log = now
+        self._suppressed_errors = 0
+
+    def preload(self, security, columns):
+        """保存済みの履歴（列配列の辞書）を読み込む。ディスクには再度書き込まない"""
+        count = len(columns["time"])
+        records = np.empty(count, dtype=self.dtype)
+        records["time"] = columns["time"]
+        for field in self.fields:
+            records[field] = columns[field] if field in columns else np.nan
+        buffer = self._buffers.get(security)
+        if buffer is None:
+            buffer = TickBuffer(self.dtype, max_rows=self.max_memory_rows)
+            self._buffers[security] = buffer
+            self._written[security] = 0
+        elif self.directory:
+            self._flush_security(security)
+        buffer.extend(records)
+        self._written[security] += count
+
+    def query(self, security, start=None, end=None, fields=None):
+        """メモリ上のティックを時刻範囲 [start, end] で検索
+
+        戻り値は {"time": ..., フィールド: ...} の配列ビューの辞書。
+        """
+        buffer = self._buffers.get(security)
+        records = buffer.records() if buffer is not None else np.empty(0, self.dtype)
+        return _slice_columns(_time_range(records, start, end),
+                              self._check_fields(fields))
+
+    def last(self, security, count, fields=None):
+        """直近 count 件のティック"""
+        buffer = self._buffers.get(security)
+        records = buffer.records() if buffer is not None else np.empty(0, self.dtype)
+        return _slice_columns(records[max(len(records) - count, 0):],
+                              self._check_fields(fields))
+
+    def flush(self):
+        """未保存のティックをディスクに追記"""
+        if not self.directory:
+            return
+        for security in self._buffers:
+            self._flush_security(security)
+
+    def _flush_security(self, security):
+        buffer = self._buffers[security]
+        start = self._written[security] - buffer.dropped
+        if start < 0:
+            # 書き出す前にメモリから捨てられた行（書き込みエラー時）
+            logger.warning(f"{security}: {-start} ticks were dropped before being saved")
+            self._written[security] = buffer.dropped
+            start = 0
+        pending = buffer.records()[start:]
+        if not len(pending):
+            return
+        times = pending["time"]
+        position = 0
+        while position < len(pending):
+            # 日付をまたぐ場合は分割して書き込む
+            boundary = np.searchsorted(times, next_midnight(times[position]), side="left")
+            chunk = pending[position:boundary]
+            path = self._day_file(security, _day_of(times[position]))
+            with open(path, "ab") as f:
+                f.write(chunk.tobytes())
+            # 途中で失敗しても書き込み済みの分は再度書かない
+            self._written[security] += len(chunk)
+            position = boundary
+
+    def _day_file(self, security, day):
+        day_dir = os.path.join(self.directory, day.strftime("%Y%m%d"))
+        os.makedirs(day_dir, exist_ok=True)
+        stem = os.path.join(day_dir, _file_stem(security))
+        if stem in self._checked_files:
+            return stem + ".ticks"
+        meta_path = stem + ".json"
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if tuple(meta["fields"]) != self.fields:
+                raise TickStoreError(
+                    f"{meta_path}: stored fields {meta['fields']} do not match {list(self.fields)}")
+        else:
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"security": security, "fields": list(self.fields)}, f)
+        self._checked_files.add(stem)
+        return stem + ".ticks"
+
+    def _check_fields(self, fields):
+        if fields is None:
+            return self.fields
+        unknown = [field for field in fields if field not in self.fields]
+        if unknown:
+            raise TickStoreError(f"unknown fields: {', '.join(unknown)}")
+        return tuple(fields)
+
+
+def _time_range(records, start, end):
+    """時刻昇順の records から [start, end] の範囲を二分探索で切り出す"""
+    times = records["time"]
+    lo = 0 if start is None else np.searchsorted(times, to_epoch(start), side="left")
+    hi = len(records) if end is None else np.searchsorted(times, to_epoch(end), side="right")
+    return records[lo:hi]
+
+
+class TickArchive:
+    """ディスクに保存されたティック履歴（読み取り専用）"""
+
+    def __init__(self, directory=TICK_DIRECTORY):
+        self.directory = directory
+
+    def days(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory)
+                      if re.fullmatch(r"\d{8}", name))
+
+    def _entries(self, day):
+        """指定日の {銘柄: (ファイルパス, フィールド)}"""
+        day_dir = os.path.join(self.directory, day)
+        entries = {}
+        for name in sorted(os.listdir(day_dir)):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(day_dir, name), encoding="utf-8") as f:
+                meta = json.load(f)
+            path = os.path.join(day_dir, name[:-len(".json")] + ".ticks")
+            if os.path.exists(path):
+                entries[meta["security"]] = (path, tuple(meta["fields"]))
+        return entries
+
+    def securities(self):
+        names = set()
+        for day in self.days():
+            names.update(self._entries(day))
+        return sorted(names)
+
+    def summary(self):
+        """(日付, 銘柄, 件数) のリスト"""
+        rows = []
+        for day in self.days():
+            for security, (path, fields) in self._entries(day).items():
+                rows.append((day, security, os.path.getsize(path) // tick_dtype(fields).itemsize))
+        return rows
+
+    def _day_entries(self, security, start, end):
+        """範囲に掛かる日ごとの (ファイルパス, フィールド)（start/end はエポック秒）"""
+        first = None if start is None else _day_of(start).strftime("%Y%m%d")
+        last = None if end is None else _day_of(end).strftime("%Y%m%d")
+        for day in self.days():
+            if (first and day < first) or (last and day > last):
+                continue
+            entry = self._entries(day).get(security)
+            if entry is not None:
+                yield entry
+
+    def check_fields(self, securities, start=None, end=None, fields=None):
+        """範囲内の保存ファイルに fields が全てあるか確認（無ければ TickStoreError）"""
+        start, end = to_epoch(start), to_epoch(end)
+        if fields is None:
+            return
+        for security in securities:
+            for _, stored in self._day_entries(security, start, end):
+                unknown = [field for field in fields if field not in stored]
+                if unknown:
+                    raise TickStoreError(f"unknown fields: {', '.join(unknown)}")
+
+    def _day_records(self, security, start, end):
+        """範囲に掛かる日ごとの records（memmapビュー）を順に返す"""
+        start, end = to_epoch(start), to_epoch(end)
+        for path, fields in self._day_entries(security, start, end):
+            dtype = tick_dtype(fields)
+            # 書き込み途中の末尾は無視する
+            rows = os.path.getsize(path) // dtype.itemsize
+            if not rows:
+                continue
+            records = np.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+            records = _time_range(records, start, end)
+            if len(records):
+                yield records, fields
+
+    def query(self, security, start=None, end=None, fields=None):
+        """時刻範囲 [start, end] のティックを列配列の辞書で返す
+
+        1日分に収まる場合はmemmapのビューをそのまま返す（コピーなし）。
+        """
+        parts = list(self._day_records(security, start, end))
+        fields = tuple(fields) if fields is not None else (parts[0][1] if parts else TICK_FIELDS)
+        for _, stored in parts:
+            unknown = [field for field in fields if field not in stored]
+            if unknown:
+                raise TickStoreError(f"unknown fields: {', '.join(unknown)}")
+        if not parts:
+            return {name: np.empty(0) for name in ("time",) + fields}
+        if len(parts) == 1:
+            return _slice_columns(parts[0][0], fields)
+        return {name: np.concatenate([records[name] for records, _ in parts])
+                for name in ("time",) + fields}
+
+    def iter_chunks(self, security, start=None, end=None, fields=None,
+                    chunk_rows=EXPORT_CHUNK_ROWS):
+        """範囲内のティックを chunk_rows 行ずつ列配列の辞書で返す"""
+        for records, stored in self._day_records(security, start, end):
+            names = tuple(fields) if fields is not None else stored
+            unknown = [field for field in names if field not in stored]
+            if unknown:
+                raise TickStoreError(f"unknown fields: {', '.join(unknown)}")
+            for position in range(0, len(records), chunk_rows):
+                # memmapから必要な行だけをメモリに読み込む
+                chunk = np.array(records[position:position + chunk_rows])
+                yield _slice_columns(chunk, names)
+
+
+def export(archive, path, securities, start=None, end=None, fields=None,
+           fmt="csv", chunk_rows=EXPORT_CHUNK_ROWS):
+    """ティック履歴を CSV / Parquet / Arrow IPC に書き出す
+
+    chunk_rows 行ずつ読み書きするため、範囲の大きさに関わらずメモリ使用量は一定。
+    path が "-" の場合はCSVを標準出力に書き出す。戻り値は書き出した行数。
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise TickStoreError(f"unknown format: {fmt}")
+    if fmt != "csv" and not PYARROW_AVAILABLE:
+        raise TickStoreError(f"{fmt} export requires pyarrow (pip install pyarrow)")
+    if chunk_rows < 1:
+        raise TickStoreError(f"chunk_rows must be positive: {chunk_rows}")
+    fields = tuple(fields) if fields is not None else TICK_FIELDS
+    # 出力ファイルを開く前に時刻とフィールドを確認する
+    start, end = to_epoch(start), to_epoch(end)
+    archive.check_fields(securities, start, end, fields)
+
+    def chunks():
+        for security in securities:
+            for columns in archive.iter_chunks(security, start, end, fields, chunk_rows):
+                yield security, columns
+
+    if fmt == "csv":
+        return _export_csv(path, fields, chunks())
+    return _export_arrow(path, fields, chunks(), fmt)
+
+
+def _iso_times(times):
+    """エポック秒 -> ISO8601 (UTC) 文字列の配列（ベクトル化）"""
+    micros = np.round(times * 1e6).astype("int64").astype("datetime64[us]")
+    return np.datetime_as_string(micros, timezone="UTC")
+
+
+def _export_csv(path, fields, chunks):
+    rows = 0
+    f = sys.stdout if path == "-" else open(path, "w", newline="", encoding="utf-8")
+    try:
+        writer = csv.writer(f)
+        writer.writerow(("security", "time") + fields)
+        for security, columns in chunks:
+            values = [columns[field].tolist() for field in fields]
+            writer.writerows(zip([security] * len(columns["time"]),
+                                 _iso_times(columns["time"]).tolist(), *values))
+            rows += len(columns["time"])
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    return rows
+
+
+def _export_arrow(path, fields, chunks, fmt):
+    schema = pa.schema([("security", pa.string()),
+                        ("time", pa.timestamp("us", tz="UTC"))]
+                       + [(field, pa.float64()) for field in fields])
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(path, schema)
+    else:
+        writer = pa.ipc.new_file(path, schema)
+    rows = 0
+    try:
+        for security, columns in chunks:
+            count = len(columns["time"])
+            micros = np.round(columns["time"] * 1e6).astype("int64")
+            arrays = [pa.array([security] * count, pa.string()),
+                      pa.array(micros, pa.int64()).cast(schema.field("time").type)]
+            arrays += [pa.array(columns[field]) for field in fields]
+            batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+            if fmt == "parquet":
+                writer.write_table(pa.Table.from_batches([batch]))
+            else:
+                writer.write_batch(batch)
+            rows += count
+    finally:
+        writer.close()
+    return rows
+
+
+def _cli_time(text):
+    """--start/--end の引数（ISO形式）"""
+    try:
+        return to_epoch(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid time: {text!r} (use ISO format)") from None
+
+
+def _cli_positive_int(text):
+    """--chunk-rows の引数（1以上の整数）"""
+    try:
+        value = int(text)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer: {text!r}")
+    return value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query and export captured ticks")
+    parser.add_argument("--directory", default=TICK_DIRECTORY,
+                        help="tick directory (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="list captured securities and tick counts per day")
+
+    export_parser = commands.add_parser("export", help="export ticks to csv/parquet/arrow")
+    export_parser.add_argument("securities", nargs="*",
+                               help="securities to export (default: all)")
+    export_parser.add_argument("--start", type=_cli_time,
+                               help="start time (ISO format, local time)")
+    export_parser.add_argument("--end", type=_cli_time,
+                               help="end time (ISO format, local time)")
+    export_parser.add_argument("--fields", help="comma separated fields (default: all)")
+    export_parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    export_parser.add_argument("-o", "--output", default="-",
+                               help="output file ('-' for stdout, csv only)")
+    export_parser.add_argument("--chunk-rows", type=_cli_positive_int, default=EXPORT_CHUNK_ROWS)
+
+    args = parser.parse_args(argv)
+    archive = TickArchive(args.directory)
+
+    try:
+        if args.command == "list":
+            for day, security, count in archive.summary():
+                print(f"{day}  {security:<24} {count:>10}")
+            return 0
+
+        if args.output == "-" and args.format != "csv":
+            parser.error(f"{args.format} export needs --output")
+        fields = args.fields.split(",") if args.fields else None
+        securities = args.securities or archive.securities()
+        rows = export(archive, args.output, securities, args.start, args.end,
+                      fields, args.format, args.chunk_rows)
+        if args.output != "-":
+            print(f"Exported {rows} ticks to {args.output}")
+        return 0
+    except TickStoreError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())